@@ -1,18 +1,61 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser
+from django.urls import reverse
+from django.utils.html import format_html
+from .models import CustomUser, Follow
 
 # Register your models here.
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
-    list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'created_at')
+    list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'followers_count', 'following_count', 'created_at')
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'created_at')
     search_fields = ('username', 'email', 'first_name', 'last_name')
     ordering = ('-created_at',)
+    readonly_fields = ('followers_link', 'following_link')
 
     fieldsets = UserAdmin.fieldsets + (
         ('Additional Info', {
-            'fields': ('bio', 'profile_picture', 'followers')
+            'fields': ('bio', 'profile_picture')
+        }),
+        ('Follows', {
+            'fields': ('followers_link', 'following_link')
         }),
     )
+
+    # Follow lists can be huge, so the user page shows the stored counters
+    # and links to the paginated Follow changelist instead of listing rows.
+    @admin.display(description='Followers')
+    def followers_link(self, obj):
+        return follow_link(obj.followers_count, followee__id__exact=obj.pk)
+
+    @admin.display(description='Following')
+    def following_link(self, obj):
+        return follow_link(obj.following_count, follower__id__exact=obj.pk)
+
+
+def follow_link(count, **lookup):
+    (field, value), = lookup.items()
+    return format_html('<a href="{}?{}={}">{}</a>', reverse('admin:accounts_follow_changelist'), field, value, count)
+
+
+@admin.register(Follow)
+class FollowAdmin(admin.ModelAdmin):
+    # Read-only: follows must go through CustomUser.follow()/unfollow() so the
+    # m2m_changed handlers update counters, timelines, the graph log and suggestions.
+    list_display = ('follower', 'followee', 'created_at')
+    list_select_related = ('follower', 'followee')
+    ordering = ('-created_at', '-id')
+    show_full_result_count = False
+
+    def lookup_allowed(self, lookup, value):
+        return lookup in ('followee__id__exact', 'follower__id__exact') or super().lookup_allowed(lookup, value)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,109 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from social_media_api.caching import cache_is_shared
+
+# TokenAuthentication joins Token and CustomUser on every API request. This
+# keeps each token's row, with its user, pickled in the shared cache for
+# AUTH_TOKEN_CACHE_TIMEOUT seconds and in a small per-process LRU for
+# AUTH_TOKEN_LOCAL_TIMEOUT seconds, so a warm request costs no query and no
+# cache round trip.
+#
+# Token changes, user saves and follow counter updates delete both entries
+# (see accounts.signals). Other processes drop their local copy when it
+# expires, so a revoked token keeps working there for at most
+# AUTH_TOKEN_LOCAL_TIMEOUT seconds.
+#
+# That bound needs a cache shared by every worker. With a per-process cache
+# (LocMemCache, the default without REDIS_URL) the delete would only reach the
+# worker that handled the logout, so only the short-lived local LRU is used.
+
+
+def token_key(key):
+    return f'auth:token:{key}'
+
+
+class LocalLRU:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout, size):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > size:
+                self.entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local = LocalLRU()
+
+
+def cached_token(key):
+    """The pickled Token (with its user) for key, or None when the key is unknown."""
+    data = local.get(key)
+    if data is None:
+        shared = cache_is_shared()
+        data = cache.get(token_key(key)) if shared else None
+        if data is None:
+            token = Token.objects.select_related('user').filter(key=key).first()
+            if token is None:
+                return None
+            data = pickle.dumps(token)
+            if shared:
+                cache.set(token_key(key), data, getattr(settings, 'AUTH_TOKEN_CACHE_TIMEOUT', 300))
+        local.set(
+            key, data,
+            getattr(settings, 'AUTH_TOKEN_LOCAL_TIMEOUT', 10),
+            getattr(settings, 'AUTH_TOKEN_LOCAL_SIZE', 10000)
+        )
+    # Each request gets its own copy, so views can modify request.user freely.
+    return pickle.loads(data)
+
+
+def invalidate(keys):
+    keys = list(keys)
+    if keys:
+        local.delete(keys)
+        cache.delete_many([token_key(key) for key in keys])
+
+
+def invalidate_users(user_ids):
+    invalidate(Token.objects.filter(user_id__in=user_ids).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        token = cached_token(key)
+        if token is None:
+            raise AuthenticationFailed('Invalid token.')
+        if not token.user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+        return (token.user, token)
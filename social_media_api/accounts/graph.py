@@ -0,0 +1,275 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from django.conf import settings
+from .models import Follow
+
+# A read-only snapshot of the follow graph in compressed sparse row form,
+# memory-mapped so every worker on the host shares one copy of the pages.
+#
+# The snapshot holds two CSR structures: one keyed by follower (whom each
+# user follows) and one keyed by followee (each user's followers). Each has
+# a sorted array of user ids, an offsets array and a targets array whose
+# rows are sorted, so membership is two binary searches.
+#
+# Follows and unfollows after the snapshot was built are appended to a delta
+# log and replayed into a small in-memory overlay. build_follow_graph writes
+# the next generation, which replays the previous log from the point where
+# the database was read, so no event is lost across the switch.
+#
+# Threads of one process share the loaded graph. Loading it and replaying the
+# log are serialized by locks, so a record is never applied twice and the
+# overlay is never read mid-update.
+
+MAGIC = b'FGRAPH01'
+HEADER = struct.Struct('<8s6q')
+RECORD = struct.Struct('<qqq')
+FOLLOW, UNFOLLOW = 1, -1
+
+
+def graph_dir():
+    return getattr(settings, 'FOLLOW_GRAPH_DIR', '')
+
+
+def snapshot_path(directory):
+    return os.path.join(directory, 'follow-graph.bin')
+
+
+def log_path(directory, generation):
+    return os.path.join(directory, f'follow-graph.{generation}.log')
+
+
+class CSR:
+    def __init__(self, nodes, offsets, targets):
+        self.nodes = nodes
+        self.offsets = offsets
+        self.targets = targets
+
+    def row(self, node):
+        index = bisect_left(self.nodes, node)
+        if index == len(self.nodes) or self.nodes[index] != node:
+            return self.targets[0:0]
+        return self.targets[self.offsets[index]:self.offsets[index + 1]]
+
+    def contains(self, node, target):
+        row = self.row(node)
+        index = bisect_left(row, target)
+        return index < len(row) and row[index] == target
+
+
+def build_csr(pairs):
+    """pairs must be sorted by (node, target)."""
+    nodes, offsets, targets = array('q'), array('q', [0]), array('q')
+    for node, target in pairs:
+        if not nodes or nodes[-1] != node:
+            if nodes:
+                offsets.append(len(targets))
+            nodes.append(node)
+        targets.append(target)
+    if nodes:
+        offsets.append(len(targets))
+    return nodes, offsets, targets
+
+
+def write_snapshot(directory, edges, generation, previous_log_offset):
+    """Atomically replace the snapshot; edges are (follower_id, followee_id) pairs."""
+    edges = sorted(set(edges))
+    following = build_csr(edges)
+    followers = build_csr(sorted((followee, follower) for follower, followee in edges))
+
+    os.makedirs(directory, exist_ok=True)
+    path = snapshot_path(directory)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as snapshot:
+        snapshot.write(HEADER.pack(
+            MAGIC, generation, previous_log_offset,
+            len(following[0]), len(following[2]), len(followers[0]), len(followers[2])
+        ))
+        for part in (*following, *followers):
+            snapshot.write(part.tobytes())
+    os.replace(temp_path, path)
+
+
+class FollowGraph:
+    def __init__(self, directory):
+        self.directory = directory
+        path = snapshot_path(directory)
+        with open(path, 'rb') as snapshot:
+            self.inode = os.fstat(snapshot.fileno()).st_ino
+            self.mmap = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.generation, previous_offset, out_nodes, out_edges, in_nodes, in_edges = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a follow graph snapshot')
+
+        values = memoryview(self.mmap)[HEADER.size:].cast('q')
+        parts = []
+        start = 0
+        for length in (out_nodes, out_nodes + 1, out_edges, in_nodes, in_nodes + 1, in_edges):
+            parts.append(values[start:start + length])
+            start += length
+        self.following = CSR(*parts[:3])
+        self.followers = CSR(*parts[3:])
+
+        self.added_following = {}
+        self.added_followers = {}
+        self.removed = set()
+        self.lock = threading.Lock()
+        self.log_offsets = {self.generation - 1: previous_offset, self.generation: 0}
+        self.replay()
+
+    def is_current(self):
+        try:
+            return os.stat(snapshot_path(self.directory)).st_ino == self.inode
+        except FileNotFoundError:
+            return False
+
+    def replay(self):
+        """Apply delta log records written since the last call."""
+        with self.lock:
+            for generation, offset in self.log_offsets.items():
+                try:
+                    with open(log_path(self.directory, generation), 'rb') as log:
+                        log.seek(offset)
+                        data = log.read()
+                except FileNotFoundError:
+                    continue
+                usable = len(data) - len(data) % RECORD.size
+                for op, follower_id, followee_id in RECORD.iter_unpack(data[:usable]):
+                    self.apply(op, follower_id, followee_id)
+                self.log_offsets[generation] = offset + usable
+
+    def apply(self, op, follower_id, followee_id):
+        """Apply one record to the overlay; callers hold self.lock."""
+        pair = (follower_id, followee_id)
+        in_snapshot = self.following.contains(follower_id, followee_id)
+        if op == FOLLOW:
+            self.removed.discard(pair)
+            if not in_snapshot:
+                self.added_following.setdefault(follower_id, set()).add(followee_id)
+                self.added_followers.setdefault(followee_id, set()).add(follower_id)
+        else:
+            self.added_following.get(follower_id, set()).discard(followee_id)
+            self.added_followers.get(followee_id, set()).discard(follower_id)
+            if in_snapshot:
+                self.removed.add(pair)
+
+    def is_following(self, follower_id, followee_id):
+        if followee_id in self.added_following.get(follower_id, ()):
+            return True
+        if (follower_id, followee_id) in self.removed:
+            return False
+        return self.following.contains(follower_id, followee_id)
+
+    def following_among(self, follower_id, user_ids):
+        return {user_id for user_id in user_ids if self.is_following(follower_id, user_id)}
+
+    def following_ids(self, user_id):
+        with self.lock:
+            ids = [followee for followee in self.following.row(user_id) if (user_id, followee) not in self.removed]
+            return ids + sorted(self.added_following.get(user_id, ()))
+
+    def follower_ids(self, user_id):
+        with self.lock:
+            ids = [follower for follower in self.followers.row(user_id) if (follower, user_id) not in self.removed]
+            return ids + sorted(self.added_followers.get(user_id, ()))
+
+
+_graph = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_graph():
+    """The current snapshot with recent deltas applied, or None when there is none."""
+    global _graph, _checked_at
+    directory = graph_dir()
+    if not directory:
+        return None
+
+    interval = getattr(settings, 'FOLLOW_GRAPH_REFRESH_INTERVAL', 1.0)
+    if time.monotonic() - _checked_at < interval:
+        return _graph
+
+    with _lock:
+        # Another thread may have refreshed while this one waited.
+        now = time.monotonic()
+        if now - _checked_at < interval:
+            return _graph
+        _checked_at = now
+
+        if _graph is None or not _graph.is_current():
+            try:
+                _graph = FollowGraph(directory)
+            except (FileNotFoundError, ValueError):
+                _graph = None
+                return None
+        else:
+            _graph.replay()
+        return _graph
+
+
+def record(op, follower_id, followee_id):
+    """Append a follow/unfollow to the delta log of the current generation."""
+    graph = get_graph()
+    if graph is None:
+        return
+    fd = os.open(log_path(graph.directory, graph.generation), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, RECORD.pack(op, follower_id, followee_id))
+    finally:
+        os.close(fd)
+    # Other processes may have appended too; replaying picks up everything in order.
+    graph.replay()
+
+
+def build(edges):
+    """Write the next generation from (follower_id, followee_id) edges read after this call.
+
+    Returns the new generation number.
+    """
+    directory = graph_dir()
+    current = get_graph()
+    generation = current.generation + 1 if current else 1
+    # Measure the live log before the caller reads the database: everything
+    # appended after this point is replayed on top of the new snapshot.
+    previous_log = log_path(directory, generation - 1)
+    previous_offset = os.path.getsize(previous_log) if os.path.exists(previous_log) else 0
+    previous_offset -= previous_offset % RECORD.size
+    write_snapshot(directory, edges(), generation, previous_offset)
+
+    for name in os.listdir(directory):
+        if name.startswith('follow-graph.') and name.endswith('.log'):
+            log_generation = name[len('follow-graph.'):-len('.log')]
+            if log_generation.isdigit() and int(log_generation) < generation - 1:
+                os.remove(os.path.join(directory, name))
+    return generation
+
+
+# Lookups used for display. They fall back to the database when no snapshot
+# exists; follow() and unfollow() always check the database itself.
+
+def is_following(user, other):
+    graph = get_graph()
+    if graph is None:
+        return user.is_following(other)
+    return graph.is_following(user.id, other.id)
+
+
+def is_followed_by(user, other):
+    graph = get_graph()
+    if graph is None:
+        return user.is_followed_by(other)
+    return graph.is_following(other.id, user.id)
+
+
+def following_among(user, user_ids):
+    """The subset of user_ids that user follows, in one lookup."""
+    graph = get_graph()
+    if graph is None:
+        return set(Follow.objects.filter(follower=user, followee_id__in=user_ids).values_list('followee_id', flat=True))
+    return graph.following_among(user.id, user_ids)
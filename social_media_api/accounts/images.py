@@ -0,0 +1,133 @@
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+from .authentication import invalidate_users
+from .models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+# Profile pictures are stored as uploaded and then resized off the request
+# thread into square WebP and JPEG thumbnails. Thumbnail names embed a hash
+# of the source bytes, so a URL never changes content and can be cached
+# forever. CustomUser.profile_picture_variants records which upload the
+# thumbnails were made from; until it matches the current picture,
+# serializers fall back to the original file.
+
+SIZES = (48, 96, 256)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+THUMBNAIL_DIR = 'profile_pics/thumbs'
+
+
+def thumbnail_name(digest, size, format):
+    return f'{THUMBNAIL_DIR}/{digest}-{size}.{EXTENSIONS[format]}'
+
+
+def render(data):
+    """Return {(size, format): bytes} for every thumbnail of the image in data."""
+    largest = max(SIZES)
+    with Image.open(BytesIO(data)) as image:
+        # Let JPEG decode at a reduced scale; thumbnails never need full resolution.
+        image.draft('RGB', (largest * 2, largest * 2))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        image = ImageOps.fit(image.convert('RGB'), (largest, largest), Image.LANCZOS)
+
+    thumbnails = {}
+    for size in SIZES:
+        resized = image if size == largest else image.resize((size, size), Image.LANCZOS)
+        for format, (pil_format, options) in FORMATS.items():
+            output = BytesIO()
+            resized.save(output, pil_format, **options)
+            thumbnails[(size, format)] = output.getvalue()
+    return thumbnails
+
+
+def process_user(user_id):
+    """Build and store thumbnails for a user's current picture. Runs in a pool worker."""
+    user = CustomUser.objects.filter(id=user_id).only('id', 'profile_picture').first()
+    if user is None or not user.profile_picture:
+        return False
+
+    source = user.profile_picture.name
+    try:
+        with user.profile_picture.open('rb') as picture:
+            data = picture.read()
+        digest = hashlib.sha256(data).hexdigest()[:20]
+        variants = {}
+        for (size, format), thumbnail in render(data).items():
+            name = thumbnail_name(digest, size, format)
+            if not default_storage.exists(name):
+                default_storage.save(name, ContentFile(thumbnail))
+            variants.setdefault(str(size), {})[format] = name
+        result = {'source': source, 'hash': digest, 'variants': variants}
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        # Recorded so the picture is not retried on every save.
+        logger.warning('Could not process profile picture %s: %s', source, e)
+        result = {'source': source, 'error': str(e)}
+
+    # A newer upload may have replaced the picture while this one was processed.
+    updated = CustomUser.objects.filter(id=user_id, profile_picture=source).update(profile_picture_variants=result)
+    if updated:
+        invalidate_users([user_id])
+    return bool(updated)
+
+
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        # Spawned workers start clean instead of inheriting this process's
+        # database connections; each sets Django up once.
+        _pool = ProcessPoolExecutor(
+            max_workers = getattr(settings, 'PROFILE_IMAGE_WORKERS', 2),
+            mp_context = multiprocessing.get_context('spawn'),
+            initializer = django.setup
+        )
+    return _pool
+
+
+def log_failure(future):
+    if future.exception() is not None:
+        logger.error('Profile picture processing failed', exc_info=future.exception())
+
+
+def needs_processing(user):
+    return bool(user.profile_picture) and (user.profile_picture_variants or {}).get('source') != user.profile_picture.name
+
+
+def schedule(user_id):
+    """Process the user's picture in the pool once the current transaction commits."""
+    transaction.on_commit(lambda: get_pool().submit(process_user, user_id).add_done_callback(log_failure))
+
+
+def pick_size(size):
+    return next((candidate for candidate in SIZES if candidate >= size), SIZES[-1])
+
+
+def avatar_urls(user, size):
+    """{'webp': url or None, 'jpeg': url} for user's picture at size pixels, or None without one."""
+    if not user.profile_picture:
+        return None
+    variants = user.profile_picture_variants or {}
+    if variants.get('source') != user.profile_picture.name or 'variants' not in variants:
+        return {'webp': None, 'jpeg': user.profile_picture.url}
+    names = variants['variants'][str(pick_size(size))]
+    return {format: default_storage.url(name) for format, name in names.items()}
@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand
+from accounts import images
+from accounts.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Build profile picture thumbnails for users that do not have them yet (or everyone with --all)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild thumbnails that already exist')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        users = CustomUser.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True).order_by('id')
+        user_ids = [
+            user.id for user in users.only('id', 'profile_picture', 'profile_picture_variants').iterator()
+            if options['all'] or images.needs_processing(user)
+        ]
+
+        processed = 0
+        pool = images.get_pool()
+        for start in range(0, len(user_ids), options['batch_size']):
+            batch = user_ids[start:start + options['batch_size']]
+            processed += sum(pool.map(images.process_user, batch))
+            self.stdout.write(f'{start + len(batch)}/{len(user_ids)} users')
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed profile pictures for {processed} users in {time.monotonic() - started:.2f}s'
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from accounts.models import CustomUser, Follow
+
+
+def follow_count(column):
+    counts = Follow.objects.filter(**{column: OuterRef('pk')}).order_by().values(column).annotate(total=Count('*')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild stored followers_count / following_count on users in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        max_id = CustomUser.objects.aggregate(max_id=Max('pk'))['max_id'] or 0
+        updated = 0
+        for start in range(0, max_id + 1, batch_size):
+            updated += CustomUser.objects.filter(pk__gte=start, pk__lt=start + batch_size).update(
+                followers_count=follow_count('followee'),
+                following_count=follow_count('follower'),
+            )
+        self.stdout.write(self.style.SUCCESS(f'Reconciled follow counters for {updated} users'))
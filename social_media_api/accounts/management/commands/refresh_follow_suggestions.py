@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from accounts import suggestions
+from accounts.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Recompute precomputed follow suggestions for queued users (or everyone with --all)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Recompute for every active user')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        started = time.monotonic()
+        if options['all']:
+            user_ids = list(CustomUser.objects.filter(is_active=True).order_by('id').values_list('id', flat=True))
+            for start in range(0, len(user_ids), batch_size):
+                suggestions.refresh(user_ids[start:start + batch_size])
+            refreshed = len(user_ids)
+        else:
+            refreshed = suggestions.drain(batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed suggestions for {refreshed} users in {time.monotonic() - started:.2f}s'
+        ))
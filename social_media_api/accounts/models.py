@@ -1,16 +1,26 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
 # Create your models here.
 class CustomUser(AbstractUser):
     bio = models.TextField(max_length=500, blank=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    # Thumbnails of profile_picture; see accounts.images.
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
     followers = models.ManyToManyField(
         'self',
         symmetrical=False,
         related_name='following',
-        blank=True
+        blank=True,
+        through='Follow',
+        through_fields=('followee', 'follower')
     )
+    followers_count = models.PositiveIntegerField(default=0, editable=False)
+    following_count = models.PositiveIntegerField(default=0, editable=False)
+    # Every notification up to this moment counts as read; see Notification.read_q.
+    notifications_read_through = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -21,30 +31,36 @@ class CustomUser(AbstractUser):
     class Meta:
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        indexes = [
+            # Prefix search on case-folded usernames; see accounts.search.
+            models.Index(Lower('username'), name='user_username_lower_idx'),
+        ]
 
     def __str__(self):
         return self.username
     
-    @property
-    def followers_count(self):
-        return self.followers.count()
-
-    @property
-    def following_count(self):
-        return self.following.count()
-
     def follow(self, user):
         if user != self and not self.is_following(user):
-            self.following.add(user)
+            # followers_count / following_count are adjusted by the m2m_changed
+            # handler in accounts.signals, inside this transaction.
+            with transaction.atomic():
+                self.following.add(user)
+            self.refresh_follow_counts(user)
             return True
         return False
 
     def unfollow(self, user):
         if user != self and self.is_following(user):
-            self.following.remove(user)
+            with transaction.atomic():
+                self.following.remove(user)
+            self.refresh_follow_counts(user)
             return True
         return False
 
+    def refresh_follow_counts(self, *users):
+        for user in (self, *users):
+            user.refresh_from_db(fields=['followers_count', 'following_count'])
+
     def is_following(self, user):
         return self.following.filter(id=user.id).exists()
 
@@ -52,5 +68,47 @@ class CustomUser(AbstractUser):
         return self.followers.filter(id=user.id).exists()
 
 
+class Follow(models.Model):
+    """follower follows followee.
+
+    This keeps the table and columns of the implicit through model that
+    CustomUser.followers used before, so existing rows carry over as-is.
+    """
+    followee = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='follower_links', db_column='from_customuser_id')
+    follower = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='following_links', db_column='to_customuser_id')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'accounts_customuser_followers'
+        unique_together = ('followee', 'follower')
+        indexes = [
+            models.Index(fields=['followee', '-created_at', '-id'], name='follow_followee_recent_idx'),
+            models.Index(fields=['follower', '-created_at', '-id'], name='follow_follower_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.follower_id} follows {self.followee_id}'
+
+
+class FollowSuggestion(models.Model):
+    """A precomputed "people you may know" entry; see accounts.suggestions."""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='follow_suggestions')
+    suggested = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    mutual_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'suggested')
+        indexes = [
+            models.Index(fields=['user', '-score'], name='follow_suggestion_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.suggested.username} for {self.user.username} ({self.score:.2f})'
 
 
+class SuggestionRefresh(models.Model):
+    """Users whose suggestions are out of date, drained by refresh_follow_suggestions."""
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    queued_at = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,6 @@
+from posts.pagination import KeysetPagination
+
+class FollowCursorPagination(KeysetPagination):
+    """Follower / following lists, newest follow first, walked with follow_*_recent_idx."""
+    page_size = 20
+    ordering = '-created_at'
@@ -0,0 +1,214 @@
+import heapq
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, When
+from django.db.models.functions import Lower
+from .models import CustomUser
+
+# User search ranks an exact username match first, then username prefix
+# matches, then substring matches, each by followers_count.
+#
+# Prefix matches are range scans on the lower(username) index. Short, hot
+# prefixes ("a", "jo") match too many rows to rank in the database, so each
+# process also keeps the most-followed users in a sorted array: when that
+# array has enough matches for a prefix they are the true top results, since
+# every user left out has fewer followers. The array is only a snapshot, so
+# it never answers alone: prefixes with fewer matches than requested, which
+# is where a newly registered or renamed user would be missing, go to the
+# index, and the exact match always comes from the database. Substring
+# matches use a pg_trgm index on PostgreSQL and a capped scan elsewhere.
+#
+# Loading the array reads up to USER_AUTOCOMPLETE_SIZE rows, so it never
+# happens inside a request: a background thread builds the next array while
+# lookups keep using the previous one (or the database, before the first).
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM_INDEX = 'accounts_customuser_username_trgm_idx'
+
+
+def autocomplete_size():
+    return getattr(settings, 'USER_AUTOCOMPLETE_SIZE', 100000)
+
+
+def create_indexes():
+    """Create the trigram index on PostgreSQL; other databases have no equivalent."""
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} ON {CustomUser._meta.db_table} '
+            f'USING GIN (lower(username) gin_trgm_ops)'
+        )
+
+
+class Autocomplete:
+    # Prefixes matching more names than this are answered by walking users in
+    # follower order instead of ranking the whole range.
+    wide_range = 1000
+
+    def __init__(self, rows):
+        """rows are (lowercased username, id, followers_count), most-followed first."""
+        order = sorted(range(len(rows)), key=lambda index: rows[index][0])
+        self.names = [rows[index][0] for index in order]
+        self.ids = array('q', [rows[index][1] for index in order])
+        self.followers = array('q', [rows[index][2] for index in order])
+        # Positions in self.names, most-followed first.
+        self.popular = array('q', [0] * len(order))
+        for position, index in enumerate(order):
+            self.popular[index] = position
+
+    @classmethod
+    def load(cls, size):
+        rows = list(
+            CustomUser.objects.filter(is_active=True)
+            .order_by('-followers_count', 'id')
+            .values_list(Lower('username'), 'id', 'followers_count')[:size]
+        )
+        return cls(rows)
+
+    def matches(self, prefix):
+        start = bisect_left(self.names, prefix)
+        end = bisect_left(self.names, prefix_upper_bound(prefix), start)
+        return start, end
+
+    def top(self, prefix, limit):
+        """ids of the most-followed users whose username starts with prefix, exact match first.
+
+        Also returns how many names matched.
+        """
+        start, end = self.matches(prefix)
+        exact = start
+        while exact < end and self.names[exact] == prefix:
+            exact += 1
+        if end - start <= self.wide_range:
+            ranked = sorted(range(exact, end), key=lambda position: -self.followers[position])[:limit]
+        else:
+            ranked = []
+            for position in self.popular:
+                if exact <= position < end:
+                    ranked.append(position)
+                    if len(ranked) == limit:
+                        break
+        positions = [*range(start, exact), *ranked][:limit]
+        return [self.ids[position] for position in positions], end - start
+
+
+_autocomplete = None
+_loaded_at = float('-inf')
+_refreshing = False
+_lock = threading.Lock()
+
+
+def refresh():
+    """Load a new array and swap it in."""
+    global _autocomplete, _loaded_at
+    autocomplete = Autocomplete.load(autocomplete_size())
+    with _lock:
+        _autocomplete = autocomplete
+        _loaded_at = time.monotonic()
+
+
+def refresh_in_background():
+    global _loaded_at, _refreshing
+    try:
+        refresh()
+    except Exception:
+        logger.exception('Could not load the user autocomplete array')
+        # Keep serving what there is and try again after the next interval.
+        with _lock:
+            _loaded_at = time.monotonic()
+    finally:
+        with _lock:
+            _refreshing = False
+        connection.close()
+
+
+def start_refresh():
+    """Start a background refresh unless one is already running in this process."""
+    global _refreshing
+    with _lock:
+        if _refreshing:
+            return False
+        _refreshing = True
+    threading.Thread(target=refresh_in_background, name='user-autocomplete-refresh', daemon=True).start()
+    return True
+
+
+def get_autocomplete():
+    """The current array, or None until the first one has loaded."""
+    if not autocomplete_size():
+        return None
+    if time.monotonic() - _loaded_at >= getattr(settings, 'USER_AUTOCOMPLETE_REFRESH_INTERVAL', 300):
+        start_refresh()
+    return _autocomplete
+
+
+def prefix_upper_bound(prefix):
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def active_users():
+    return CustomUser.objects.filter(is_active=True).alias(username_lower=Lower('username'))
+
+
+def exact_match(query):
+    return list(active_users().filter(username_lower=query).values_list('id', flat=True)[:1])
+
+
+def prefix_matches(query, limit):
+    # The range drives user_username_lower_idx; istartswith keeps the result exact under any collation.
+    users = active_users().filter(
+        username_lower__gte = query,
+        username_lower__lt = prefix_upper_bound(query),
+        username__istartswith = query
+    )
+    return list(users.order_by('-followers_count', 'id').values_list('id', flat=True)[:limit])
+
+
+def substring_matches(query, limit, exclude):
+    users = active_users().filter(username_lower__contains=query).exclude(id__in=exclude)
+    if connection.vendor == 'postgresql':
+        return list(users.order_by('-followers_count', 'id').values_list('id', flat=True)[:limit])
+    # Without a trigram index, bound the scan and rank what it found.
+    rows = users.values_list('id', 'followers_count')[:getattr(settings, 'USER_SEARCH_SCAN_LIMIT', 5000)]
+    return [user_id for user_id, _ in heapq.nsmallest(limit, rows, key=lambda row: (-row[1], row[0]))]
+
+
+def search_ids(query, limit=10, substring=True):
+    query = query.strip().lower()
+    if not query:
+        return []
+
+    ids = None
+    autocomplete = get_autocomplete()
+    if autocomplete is not None:
+        top, matched = autocomplete.top(query, limit)
+        if matched >= limit:
+            # The exact match may be missing from the array or renamed since it was loaded.
+            exact = exact_match(query)
+            ids = exact + [user_id for user_id in top if user_id not in exact]
+    if ids is None:
+        exact = exact_match(query)
+        ids = exact + [user_id for user_id in prefix_matches(query, limit) if user_id not in exact]
+    ids = ids[:limit]
+
+    if substring and len(ids) < limit:
+        ids += substring_matches(query, limit - len(ids), ids)
+    return ids
+
+
+def search_users(query, limit=10, substring=True):
+    """Active users matching query, best match first."""
+    ids = search_ids(query, limit, substring)
+    if not ids:
+        return []
+    rank = Case(*[When(id=user_id, then=position) for position, user_id in enumerate(ids)], output_field=IntegerField())
+    # The array may hold users deactivated since it was loaded.
+    return list(CustomUser.objects.filter(id__in=ids, is_active=True).order_by(rank))
@@ -3,9 +3,37 @@ from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 from django.contrib.auth import get_user_model
 from .models import CustomUser
+from . import graph, images
 from rest_framework.authtoken.models import Token
 
 
+class AvatarField(serializers.Field):
+    """URLs of the user's profile picture thumbnail closest to size pixels."""
+
+    def __init__(self, size, **kwargs):
+        self.size = size
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, user):
+        return images.avatar_urls(user, self.size)
+
+
+class EditedFieldsUpdateMixin:
+    """Save only the fields being edited on update.
+
+    request.user is a snapshot from the token cache (accounts.authentication),
+    so a full save could write stale counters and watermarks back to the row.
+    """
+
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
+
+
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8, validators=[validate_password])
     password2 = serializers.CharField(write_only=True, min_length=8)
@@ -62,17 +90,18 @@ class UserLoginSerializer(serializers.Serializer):
 class UserProfileSerializer(serializers.ModelSerializer):
     followers_count = serializers.ReadOnlyField()
     following_count = serializers.ReadOnlyField()
+    avatar = AvatarField(size=96)
 
     class Meta:
         model = CustomUser
         fields = (
             'id', 'username', 'email', 'first_name', 'last_name', 
-            'bio', 'profile_picture', 'followers_count', 'following_count',
+            'bio', 'profile_picture', 'avatar', 'followers_count', 'following_count',
             'created_at', 'updated_at'
         )
         read_only_fields = ('id', 'created_at', 'updated_at')
 
-class UserUpdateSerializer(serializers.ModelSerializer):
+class UserUpdateSerializer(EditedFieldsUpdateMixin, serializers.ModelSerializer):
     class Meta:
         model = CustomUser
         fields = ('first_name', 'last_name', 'bio', 'profile_picture')
@@ -84,29 +113,43 @@ class UserUpdateSerializer(serializers.ModelSerializer):
 
 class UserFollowSerializer(serializers.ModelSerializer):
     is_following = serializers.SerializerMethodField()
+    avatar = AvatarField(size=48)
     
     class Meta:
         model = CustomUser
-        fields = ('id', 'username', 'is_following')
+        fields = ('id', 'username', 'avatar', 'is_following')
         read_only_fields = ('id', 'username', 'is_following')
     
     def get_is_following(self, obj):
+        # Views that already know the answer for the whole list pass following_ids.
+        following_ids = self.context.get('following_ids')
+        if following_ids is not None:
+            return obj.id in following_ids
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return request.user.is_following(obj)
+            return graph.is_following(request.user, obj)
         return False
 
+class UserAutocompleteSerializer(serializers.ModelSerializer):
+    avatar = AvatarField(size=48)
+
+    class Meta:
+        model = CustomUser
+        fields = ('id', 'username', 'avatar', 'followers_count')
+        read_only_fields = fields
+
 class UserDetailSerializer(serializers.ModelSerializer):
     followers_count = serializers.ReadOnlyField()
     following_count = serializers.ReadOnlyField()
     is_following = serializers.SerializerMethodField()
     is_followed_by = serializers.SerializerMethodField()
+    avatar = AvatarField(size=256)
     
     class Meta:
         model = CustomUser
         fields = (
             'id', 'username', 'email', 'first_name', 'last_name', 
-            'bio', 'profile_picture', 'followers_count', 'following_count',
+            'bio', 'profile_picture', 'avatar', 'followers_count', 'following_count',
             'is_following', 'is_followed_by', 'created_at', 'updated_at'
         )
         read_only_fields = ('id', 'created_at', 'updated_at')
@@ -114,13 +157,13 @@ class UserDetailSerializer(serializers.ModelSerializer):
     def get_is_following(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return request.user.is_following(obj)
+            return graph.is_following(request.user, obj)
         return False
     
     def get_is_followed_by(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return request.user.is_followed_by(obj)
+            return graph.is_followed_by(request.user, obj)
         return False
 
 class FollowActionSerializer(serializers.Serializer):
@@ -137,7 +180,9 @@ class FollowActionSerializer(serializers.Serializer):
         
         return value
     
-class CustomUserSerializer(serializers.ModelSerializer):
+class CustomUserSerializer(EditedFieldsUpdateMixin, serializers.ModelSerializer):
+    avatar = AvatarField(size=96)
+
     class Meta:
         model = CustomUser
-        fields = ['id', 'username', 'email', 'bio', 'profile_picture']
\ No newline at end of file
+        fields = ['id', 'username', 'email', 'bio', 'profile_picture', 'avatar']
\ No newline at end of file
@@ -0,0 +1,123 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .models import CustomUser, Follow, FollowSuggestion
+from . import authentication, graph, images, search, suggestions
+
+def adjust_follow_counts(instance, reverse, user_ids, delta):
+    """Shift stored counters for follow rows between instance and user_ids.
+
+    reverse=True means the change came through instance.following, so
+    instance is the follower; otherwise instance is the one being followed.
+    """
+    if not user_ids:
+        return
+    own_field, other_field = ('following_count', 'followers_count') if reverse else ('followers_count', 'following_count')
+    own = CustomUser.objects.filter(pk=instance.pk)
+    others = CustomUser.objects.filter(pk__in=user_ids)
+    if delta < 0:
+        own = own.filter(**{f'{own_field}__gte': len(user_ids)})
+        others = others.filter(**{f'{other_field}__gte': 1})
+    own.update(**{own_field: F(own_field) + delta * len(user_ids)})
+    others.update(**{other_field: F(other_field) + delta})
+    # Cached request.user objects carry the counters too.
+    user_ids = [instance.pk, *user_ids]
+    transaction.on_commit(lambda: authentication.invalidate_users(user_ids))
+
+
+def existing_follow_ids(instance, reverse, pk_set=None):
+    if reverse:
+        rows = Follow.objects.filter(follower=instance)
+        column = 'followee_id'
+    else:
+        rows = Follow.objects.filter(followee=instance)
+        column = 'follower_id'
+    if pk_set is not None:
+        rows = rows.filter(**{f'{column}__in': pk_set})
+    return set(rows.values_list(column, flat=True))
+
+
+def record_follow_edges(instance, reverse, user_ids, op):
+    """Queue the change for the follow graph delta log once it commits."""
+    if reverse:
+        edges = [(instance.pk, user_id) for user_id in user_ids]
+    else:
+        edges = [(user_id, instance.pk) for user_id in user_ids]
+
+    def append():
+        for follower_id, followee_id in edges:
+            graph.record(op, follower_id, followee_id)
+    if edges:
+        transaction.on_commit(append)
+
+
+def refresh_suggestions(instance, reverse, user_ids, followed):
+    """Queue the followers for a suggestion refresh; drop suggestions they just acted on."""
+    if not user_ids:
+        return
+    follower_ids = [instance.pk] if reverse else list(user_ids)
+    if followed:
+        if reverse:
+            FollowSuggestion.objects.filter(user=instance, suggested_id__in=user_ids).delete()
+        else:
+            FollowSuggestion.objects.filter(user_id__in=user_ids, suggested=instance).delete()
+    suggestions.queue(follower_ids)
+
+
+@receiver(m2m_changed, sender=Follow)
+def update_follow_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add':
+        # Django only reports the ids that were actually inserted.
+        adjust_follow_counts(instance, reverse, pk_set, 1)
+        record_follow_edges(instance, reverse, pk_set, graph.FOLLOW)
+        refresh_suggestions(instance, reverse, pk_set, followed=True)
+    elif action in ('pre_remove', 'pre_clear'):
+        # remove() and clear() report what was asked for, so look up what really exists.
+        instance._removed_follow_ids = existing_follow_ids(instance, reverse, pk_set)
+    elif action in ('post_remove', 'post_clear'):
+        removed_ids = getattr(instance, '_removed_follow_ids', set())
+        adjust_follow_counts(instance, reverse, removed_ids, -1)
+        record_follow_edges(instance, reverse, removed_ids, graph.UNFOLLOW)
+        refresh_suggestions(instance, reverse, removed_ids, followed=False)
+        instance._removed_follow_ids = set()
+
+
+@receiver(pre_delete, sender=CustomUser)
+def release_follows(sender, instance, **kwargs):
+    # The user's Follow rows go by cascade, which m2m_changed never reports.
+    follower_ids = existing_follow_ids(instance, False)
+    followee_ids = existing_follow_ids(instance, True)
+    adjust_follow_counts(instance, False, follower_ids, -1)
+    adjust_follow_counts(instance, True, followee_ids, -1)
+    record_follow_edges(instance, False, follower_ids, graph.UNFOLLOW)
+    record_follow_edges(instance, True, followee_ids, graph.UNFOLLOW)
+    suggestions.queue(follower_ids)
+
+
+@receiver(post_migrate)
+def create_search_indexes(sender, using, **kwargs):
+    if sender.name == 'accounts':
+        search.create_indexes()
+
+
+@receiver([post_save, post_delete], sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    # Token.delete() clears instance.key before the transaction commits.
+    key = instance.key
+    transaction.on_commit(lambda: authentication.invalidate([key]))
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Covers deactivation and every other change to the cached user row.
+    transaction.on_commit(lambda: authentication.invalidate_users([instance.pk]))
+
+
+@receiver(post_save, sender=CustomUser)
+def process_profile_picture(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'profile_picture' not in update_fields:
+        return
+    if images.needs_processing(instance):
+        images.schedule(instance.pk)
@@ -0,0 +1,132 @@
+import heapq
+import math
+from collections import Counter
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from . import graph
+from .models import CustomUser, Follow, FollowSuggestion, SuggestionRefresh
+
+# "People you may know": a candidate's score is the number of people the user
+# follows who also follow the candidate (friends of friends), plus a damped
+# popularity term. Scores are computed for a batch of users at a time -- one
+# grouped two-hop join, or CSR row walks when the follow graph snapshot is
+# available -- and stored in FollowSuggestion so the endpoint is one indexed
+# read. Following or unfollowing queues the follower for a refresh.
+
+
+def suggestions_limit():
+    return getattr(settings, 'FOLLOW_SUGGESTIONS_LIMIT', 50)
+
+
+def popularity_weight():
+    return getattr(settings, 'FOLLOW_SUGGESTIONS_POPULARITY_WEIGHT', 0.5)
+
+
+def following_map(user_ids):
+    """user id -> ids of the users they follow."""
+    snapshot = graph.get_graph()
+    if snapshot is not None:
+        return {user_id: set(snapshot.following_ids(user_id)) for user_id in user_ids}
+
+    following = {user_id: set() for user_id in user_ids}
+    rows = Follow.objects.filter(follower_id__in=user_ids).values_list('follower_id', 'followee_id')
+    for follower_id, followee_id in rows:
+        following[follower_id].add(followee_id)
+    return following
+
+
+def mutual_counts(user_ids, following):
+    """user id -> Counter of candidate id -> how many of the user's followees follow the candidate."""
+    snapshot = graph.get_graph()
+    if snapshot is not None:
+        return {
+            user_id: Counter(
+                candidate for followee_id in following[user_id]
+                for candidate in snapshot.following_ids(followee_id)
+            )
+            for user_id in user_ids
+        }
+
+    counts = {user_id: Counter() for user_id in user_ids}
+    rows = (
+        CustomUser.objects.filter(followers__followers__in=user_ids)
+        .values_list('followers__followers', 'id')
+        .annotate(mutual=Count('*'))
+        .order_by()
+    )
+    for user_id, candidate, mutual in rows:
+        counts[user_id][candidate] = mutual
+    return counts
+
+
+def popular_user_ids(limit):
+    return list(CustomUser.objects.filter(is_active=True).order_by('-followers_count', 'id').values_list('id', flat=True)[:limit])
+
+
+def score(mutual, followers_count):
+    return mutual + popularity_weight() * math.log1p(followers_count)
+
+
+def compute(user_ids):
+    """Return FollowSuggestion rows (unsaved) for user_ids."""
+    limit = suggestions_limit()
+    following = following_map(user_ids)
+    mutuals = mutual_counts(user_ids, following)
+    popular = popular_user_ids(limit * 2)
+
+    candidates = {}
+    for user_id in user_ids:
+        excluded = following[user_id] | {user_id}
+        mutual = {candidate: count for candidate, count in mutuals[user_id].items() if candidate not in excluded}
+        # Keep the strongest friends-of-friends, then top up with popular users for sparse graphs.
+        ranked = dict(heapq.nlargest(limit * 2, mutual.items(), key=lambda item: item[1]))
+        for candidate in popular:
+            if candidate not in excluded:
+                ranked.setdefault(candidate, 0)
+        candidates[user_id] = ranked
+
+    candidate_ids = {candidate for ranked in candidates.values() for candidate in ranked}
+    followers_counts = dict(
+        CustomUser.objects.filter(id__in=candidate_ids, is_active=True).values_list('id', 'followers_count')
+    )
+
+    rows = []
+    for user_id, ranked in candidates.items():
+        scored = [
+            (score(mutual, followers_counts[candidate]), candidate, mutual)
+            for candidate, mutual in ranked.items() if candidate in followers_counts
+        ]
+        for value, candidate, mutual in heapq.nlargest(limit, scored):
+            rows.append(FollowSuggestion(user_id=user_id, suggested_id=candidate, score=value, mutual_count=mutual))
+    return rows
+
+
+def refresh(user_ids):
+    started = timezone.now()
+    rows = compute(user_ids)
+    with transaction.atomic():
+        FollowSuggestion.objects.filter(user_id__in=user_ids).delete()
+        FollowSuggestion.objects.bulk_create(rows)
+        # Keep entries queued while this batch was computing.
+        SuggestionRefresh.objects.filter(user_id__in=user_ids, queued_at__lte=started).delete()
+    return len(rows)
+
+
+def drain(batch_size=500):
+    """Refresh every queued user. Returns the number of users refreshed."""
+    refreshed = 0
+    while True:
+        user_ids = list(SuggestionRefresh.objects.order_by('queued_at').values_list('user_id', flat=True)[:batch_size])
+        if not user_ids:
+            return refreshed
+        refresh(user_ids)
+        refreshed += len(user_ids)
+
+
+def queue(user_ids):
+    transaction.on_commit(lambda: SuggestionRefresh.objects.bulk_create(
+        [SuggestionRefresh(user_id=user_id) for user_id in user_ids],
+        ignore_conflicts=True
+    ))
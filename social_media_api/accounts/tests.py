@@ -1,3 +1,406 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from concurrent.futures import Future
+from io import BytesIO, StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from .models import CustomUser, SuggestionRefresh
+from . import authentication, graph, images, search
 
-# Create your tests here.
+
+def make_user(username):
+    return CustomUser.objects.create_user(username=username, email=f'{username}@example.com', password='password')
+
+
+class FollowCounterTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.carol = make_user('carol')
+
+    def assertCounts(self, user, followers, following):
+        user.refresh_from_db()
+        self.assertEqual((user.followers_count, user.following_count), (followers, following))
+
+    def test_follow_and_unfollow_update_both_users(self):
+        self.assertTrue(self.alice.follow(self.bob))
+        self.assertFalse(self.alice.follow(self.bob))
+        self.assertCounts(self.alice, 0, 1)
+        self.assertCounts(self.bob, 1, 0)
+        self.assertTrue(self.alice.unfollow(self.bob))
+        self.assertFalse(self.alice.unfollow(self.bob))
+        self.assertCounts(self.alice, 0, 0)
+        self.assertCounts(self.bob, 0, 0)
+
+    def test_repeated_follow_requests_count_once(self):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        responses = [client.post('/auth/api/follow/', {'user_id': self.bob.id}) for _ in range(3)]
+        self.assertEqual([response.status_code for response in responses], [200, 400, 400])
+        self.assertEqual(responses[0].data['followers_count'], 1)
+        self.assertCounts(self.alice, 0, 1)
+        self.assertCounts(self.bob, 1, 0)
+        client.post('/auth/api/unfollow/', {'user_id': self.bob.id})
+        self.assertCounts(self.bob, 0, 0)
+
+    def test_deleting_a_user_releases_their_follows(self):
+        self.alice.follow(self.bob)
+        self.bob.follow(self.carol)
+        self.carol.follow(self.bob)
+        SuggestionRefresh.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bob.delete()
+        self.assertCounts(self.alice, 0, 0)
+        self.assertCounts(self.carol, 0, 0)
+        self.assertEqual(
+            set(SuggestionRefresh.objects.values_list('user_id', flat=True)),
+            {self.alice.id, self.carol.id}
+        )
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class FollowAdminTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(username='admin', email='admin@example.com', password='password')
+        self.bob = make_user('bob')
+        self.followers = [make_user(f'follower{i}') for i in range(3)]
+        for user in self.followers:
+            user.follow(self.bob)
+        self.client.force_login(self.admin)
+
+    def test_user_page_links_to_followers_instead_of_listing_them(self):
+        response = self.client.get(f'/admin/accounts/customuser/{self.bob.id}/change/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'follower0')
+        self.assertContains(response, f'/admin/accounts/follow/?followee__id__exact={self.bob.id}">3</a>', html=False)
+
+    def test_follow_changelist_is_filtered_and_read_only(self):
+        self.followers[0].follow(self.followers[1])
+        response = self.client.get(f'/admin/accounts/follow/?followee__id__exact={self.bob.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {follow.follower.username for follow in response.context['cl'].result_list},
+            {'follower0', 'follower1', 'follower2'}
+        )
+        self.assertFalse(response.context['has_add_permission'])
+        self.assertEqual(self.client.get('/admin/accounts/follow/add/').status_code, 403)
+
+
+class CachedTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.local.clear()
+        self.user = make_user('alice')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_logout_revokes_the_cached_token(self):
+        self.assertEqual(self.client.get('/auth/api/profile/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/auth/api/logout/').status_code, 200)
+        self.assertEqual(self.client.get('/auth/api/profile/').status_code, 401)
+
+    def test_per_process_cache_is_not_used_for_tokens(self):
+        # LocMemCache is private to each worker, so a logout on one worker could
+        # not remove the entry from the others.
+        self.client.get('/auth/api/profile/')
+        self.assertIsNone(cache.get(authentication.token_key(self.token.key)))
+
+    def test_revocation_reaches_other_workers_through_a_shared_cache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}
+        with self.settings(CACHES=shared):
+            self.assertEqual(self.client.get('/auth/api/profile/').status_code, 200)
+            self.assertIsNotNone(cache.get(authentication.token_key(self.token.key)))
+            with self.captureOnCommitCallbacks(execute=True):
+                self.token.delete()
+            # Another worker has no local copy and must not find one in the shared cache.
+            authentication.local.clear()
+            self.assertEqual(self.client.get('/auth/api/profile/').status_code, 401)
+
+    def test_profile_update_keeps_fields_changed_elsewhere(self):
+        # Warm the cache, then change the row behind the cached user's back.
+        self.client.get('/auth/api/profile/')
+        read_through = timezone.now()
+        CustomUser.objects.filter(id=self.user.id).update(followers_count=7, notifications_read_through=read_through)
+        response = self.client.put('/auth/api/profile/', {'bio': 'Hello'})
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.bio, 'Hello')
+        self.assertEqual(self.user.followers_count, 7)
+        self.assertEqual(self.user.notifications_read_through, read_through)
+
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        search._autocomplete = None
+        search._loaded_at = float('-inf')
+        # Load the array explicitly; a background thread would not see the test transaction.
+        patcher = mock.patch.object(search, 'start_refresh')
+        self.start_refresh = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.users = [make_user(name) for name in ('zara', 'zoe', 'zack')]
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def autocomplete(self, query, limit=8):
+        response = self.client.get('/auth/api/search/autocomplete/', {'q': query, 'limit': limit})
+        return [user['username'] for user in response.data]
+
+    def test_requests_use_the_database_until_the_array_has_loaded(self):
+        self.assertCountEqual(self.autocomplete('z'), ['zara', 'zoe', 'zack'])
+        self.assertIsNone(search._autocomplete)
+        self.start_refresh.assert_called()
+        search.refresh()
+        self.start_refresh.reset_mock()
+        self.assertEqual(self.autocomplete('zo'), ['zoe'])
+        self.start_refresh.assert_not_called()
+
+    def test_users_added_after_the_snapshot_are_found(self):
+        search.refresh()
+        make_user('zedd')
+        self.assertEqual(self.autocomplete('zed'), ['zedd'])
+
+    def test_renamed_users_are_found_by_their_new_name(self):
+        search.refresh()
+        self.users[1].username = 'zoey'
+        self.users[1].save()
+        self.assertEqual(self.autocomplete('zoey', limit=1), ['zoey'])
+        self.assertEqual(self.autocomplete('zoey'), ['zoey'])
+
+    def test_exact_match_comes_first(self):
+        self.users[0].follow(self.users[2])
+        make_user('z')
+        search.refresh()
+        self.assertEqual(self.autocomplete('z', limit=2), ['z', 'zack'])
+
+
+class AutocompleteRefreshTests(TestCase):
+    def setUp(self):
+        search._refreshing = False
+        self.addCleanup(setattr, search, '_refreshing', False)
+
+    def test_only_one_refresh_runs_at_a_time(self):
+        with mock.patch.object(search.threading, 'Thread') as thread:
+            self.assertTrue(search.start_refresh())
+            self.assertFalse(search.start_refresh())
+        thread.assert_called_once()
+
+    def test_failed_refresh_keeps_the_previous_array(self):
+        previous = search.Autocomplete([('zara', 1, 0)])
+        search._autocomplete = previous
+        self.addCleanup(setattr, search, '_autocomplete', None)
+        search._refreshing = True
+        with mock.patch.object(search.Autocomplete, 'load', side_effect=DatabaseError), \
+                mock.patch.object(search, 'connection'), self.assertLogs('accounts.search', 'ERROR'):
+            search.refresh_in_background()
+        self.assertIs(search._autocomplete, previous)
+        self.assertFalse(search._refreshing)
+        self.assertIs(search.get_autocomplete(), previous)
+
+
+class FollowSuggestionTests(TestCase):
+    def setUp(self):
+        self.users = {name: make_user(name) for name in ('ann', 'ben', 'cat', 'dan', 'eve', 'fay', 'gus')}
+        self.users['gus'].is_active = False
+        self.users['gus'].save()
+        with self.captureOnCommitCallbacks(execute=True):
+            for follower, followee in [
+                ('ann', 'ben'), ('ann', 'cat'), ('ann', 'eve'),
+                ('ben', 'dan'), ('ben', 'eve'), ('ben', 'gus'), ('cat', 'dan'),
+            ]:
+                self.users[follower].follow(self.users[followee])
+
+    def refresh(self, *args):
+        call_command('refresh_follow_suggestions', *args, stdout=StringIO())
+
+    def suggested(self, name):
+        return [
+            (suggestion.suggested.username, suggestion.mutual_count)
+            for suggestion in self.users[name].follow_suggestions.order_by('-score', 'suggested_id')
+        ]
+
+    def test_friends_of_friends_are_suggested(self):
+        self.assertEqual(
+            set(SuggestionRefresh.objects.values_list('user_id', flat=True)),
+            {self.users[name].id for name in ('ann', 'ben', 'cat')}
+        )
+        self.refresh()
+        self.assertFalse(SuggestionRefresh.objects.exists())
+        # dan is followed by two of ann's followees; eve is already followed,
+        # gus is inactive, and fay tops up the list from popularity alone.
+        suggested = self.suggested('ann')
+        self.assertEqual(suggested[0], ('dan', 2))
+        self.assertEqual(dict(suggested), {'dan': 2, 'fay': 0})
+        self.assertFalse(self.users['dan'].follow_suggestions.exists())
+
+    def test_following_a_suggestion_requeues_and_drops_it(self):
+        self.refresh()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users['ann'].follow(self.users['dan'])
+        self.assertEqual(list(SuggestionRefresh.objects.values_list('user_id', flat=True)), [self.users['ann'].id])
+        self.refresh()
+        self.assertEqual(dict(self.suggested('ann')), {'fay': 0})
+        self.assertFalse(SuggestionRefresh.objects.exists())
+
+    def test_all_refreshes_users_that_were_not_queued(self):
+        SuggestionRefresh.objects.all().delete()
+        self.refresh('--all', '--batch-size', '2')
+        self.assertEqual(dict(self.suggested('ann')), {'dan': 2, 'fay': 0})
+        self.assertIn(('ann', 0), self.suggested('dan'))
+
+
+class InlinePool:
+    """Stands in for the process pool, running work in the calling thread."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def map(self, fn, iterable):
+        return map(fn, iterable)
+
+
+class ProfilePictureTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = self.settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        patcher = mock.patch.object(images, 'get_pool', return_value=InlinePool())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+        self.user = make_user('painter')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self):
+        picture = BytesIO()
+        Image.new('RGBA', (300, 200), (200, 30, 30, 128)).save(picture, 'PNG')
+        upload = SimpleUploadedFile('me.png', picture.getvalue(), content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put('/auth/api/profile/', {'profile_picture': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_upload_builds_every_thumbnail(self):
+        response = self.upload()
+        # Serialized before the thumbnails existed: the original file.
+        self.assertEqual(response.data['avatar']['webp'], None)
+        self.assertTrue(response.data['avatar']['jpeg'].endswith('.png'))
+
+        self.user.refresh_from_db()
+        variants = self.user.profile_picture_variants
+        self.assertEqual(variants['source'], self.user.profile_picture.name)
+        for size in images.SIZES:
+            for format in images.FORMATS:
+                with default_storage.open(variants['variants'][str(size)][format]) as thumbnail, Image.open(thumbnail) as image:
+                    self.assertEqual((image.format, image.size), (images.FORMATS[format][0], (size, size)))
+
+    def test_serializers_pick_the_size_they_display(self):
+        self.upload()
+        self.user.refresh_from_db()
+        names = self.user.profile_picture_variants['variants']
+        profile = self.client.get('/auth/api/profile/').data['avatar']
+        detail = self.client.get(f'/auth/api/user/{self.user.id}/').data['avatar']
+        self.assertEqual(profile, {format: default_storage.url(name) for format, name in names['96'].items()})
+        self.assertEqual(detail['webp'], default_storage.url(names['256']['webp']))
+        self.assertEqual(images.avatar_urls(self.user, 40)['jpeg'], default_storage.url(names['48']['jpeg']))
+        self.assertEqual(images.avatar_urls(self.user, 1024)['jpeg'], default_storage.url(names['256']['jpeg']))
+
+    def test_unreadable_upload_is_recorded_once(self):
+        self.user.profile_picture = SimpleUploadedFile('broken.png', b'not an image')
+        with self.assertLogs('accounts.images', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.user.refresh_from_db()
+        self.assertIn('error', self.user.profile_picture_variants)
+        self.assertFalse(images.needs_processing(self.user))
+        self.assertEqual(images.avatar_urls(self.user, 96), {'webp': None, 'jpeg': self.user.profile_picture.url})
+
+
+class FollowGraphTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = self.settings(FOLLOW_GRAPH_DIR=self.directory, FOLLOW_GRAPH_REFRESH_INTERVAL=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        graph._graph = None
+        self.addCleanup(setattr, graph, '_graph', None)
+        self.users = [make_user(f'user{i}') for i in range(4)]
+
+    def follow(self, follower, followee):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users[follower].follow(self.users[followee])
+
+    def unfollow(self, follower, followee):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users[follower].unfollow(self.users[followee])
+
+    def ids(self, *indexes):
+        return [self.users[index].id for index in indexes]
+
+    def build(self):
+        call_command('build_follow_graph', stdout=StringIO())
+
+    def test_build_csr(self):
+        nodes, offsets, targets = graph.build_csr([(1, 2), (1, 3), (4, 1)])
+        self.assertEqual((list(nodes), list(offsets), list(targets)), ([1, 4], [0, 2, 3], [2, 3, 1]))
+        csr = graph.CSR(nodes, offsets, targets)
+        self.assertTrue(csr.contains(1, 3))
+        self.assertFalse(csr.contains(4, 2))
+        self.assertEqual(list(csr.row(2)), [])
+
+    def test_snapshot_is_loaded_from_the_mapped_file(self):
+        graph.write_snapshot(self.directory, [(1, 3), (1, 2), (2, 3), (1, 2)], 1, 0)
+        snapshot = graph.FollowGraph(self.directory)
+        self.assertEqual(snapshot.generation, 1)
+        self.assertEqual(snapshot.following_ids(1), [2, 3])
+        self.assertEqual(snapshot.follower_ids(3), [1, 2])
+        self.assertFalse(snapshot.is_following(2, 1))
+
+    def test_changes_after_the_snapshot_are_replayed(self):
+        self.follow(0, 1)
+        self.follow(0, 2)
+        self.build()
+        self.follow(0, 3)
+        self.unfollow(0, 1)
+        # A process that loads the snapshot now replays the log on top of it.
+        loaded = graph.FollowGraph(self.directory)
+        for current in (graph.get_graph(), loaded):
+            self.assertEqual(current.following_ids(self.users[0].id), self.ids(2, 3))
+            self.assertEqual(current.follower_ids(self.users[1].id), [])
+        self.assertEqual(graph.following_among(self.users[0], self.ids(1, 2, 3)), set(self.ids(2, 3)))
+
+    def test_rebuild_switches_generation_and_compacts_the_log(self):
+        self.follow(0, 1)
+        self.build()
+        self.follow(1, 2)
+        old = graph.get_graph()
+        self.build()
+        self.follow(2, 3)
+        self.build()
+        self.assertFalse(old.is_current())
+        current = graph.get_graph()
+        self.assertEqual(current.generation, 3)
+        logs = sorted(name for name in os.listdir(self.directory) if name.endswith('.log'))
+        self.assertEqual(logs, ['follow-graph.2.log'])
+        self.assertEqual(
+            {(user.id, followee) for user in self.users for followee in current.following_ids(user.id)},
+            {tuple(self.ids(0, 1)), tuple(self.ids(1, 2)), tuple(self.ids(2, 3))}
+        )
@@ -21,4 +21,5 @@ urlpatterns = [
     path('api/following/', views.get_following, name='following_api'),
     path('api/user/<int:user_id>/', views.user_detail, name='user_detail_api'),
     path('api/search/', views.user_search, name='user_search_api'),
+    path('api/search/autocomplete/', views.user_autocomplete, name='user_autocomplete_api'),
 ]
\ No newline at end of file
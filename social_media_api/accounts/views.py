@@ -2,13 +2,16 @@ from rest_framework.authtoken.models import Token
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from rest_framework import status, generics, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from .models import CustomUser
-from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserProfileSerializer, UserUpdateSerializer, FollowActionSerializer, UserDetailSerializer, UserFollowSerializer, CustomUserSerializer
-from notifications.models import Notification
+from .models import CustomUser, Follow
+from . import graph, search
+from .pagination import FollowCursorPagination
+from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserProfileSerializer, UserUpdateSerializer, FollowActionSerializer, UserDetailSerializer, UserFollowSerializer, UserAutocompleteSerializer, CustomUserSerializer
+from notifications.models import NotificationOutbox
 
 # Create your views here.
 class UserRegistrationAPIView(generics.GenericAPIView):
@@ -137,12 +140,15 @@ def follow_user(request):
     if serializer.is_valid():
         user_to_follow = get_object_or_404(CustomUser, id = serializer.validated_data['user_id'])
 
-        if request.user.follow(user_to_follow):
-            Notification.create_notification(
-                recipient=user_to_follow,
-                actor=request.user,
-                verb='follow'
-            )
+        with transaction.atomic():
+            followed = request.user.follow(user_to_follow)
+            if followed:
+                NotificationOutbox.enqueue(
+                    recipient=user_to_follow,
+                    actor=request.user,
+                    verb='follow'
+                )
+        if followed:
             return Response({
                 'message': f'You are now following {user_to_follow.username}',
                 'following': True,
@@ -179,16 +185,25 @@ def unfollow_user(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_followers(request):
-    followers = request.user.followers.all()
-    serializer = UserFollowSerializer(followers, many = True, context = {'request': request})
-    return Response(serializer.data)
+    paginator = FollowCursorPagination()
+    links = paginator.paginate_queryset(
+        Follow.objects.filter(followee=request.user).select_related('follower'), request
+    )
+    followers = [link.follower for link in links]
+    following_ids = graph.following_among(request.user, [user.id for user in followers])
+    serializer = UserFollowSerializer(followers, many = True, context = {'request': request, 'following_ids': following_ids})
+    return paginator.get_paginated_response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_following(request):
-    following = request.user.following.all()
-    serializer = UserFollowSerializer(following, many = True, context = {'request': request})
-    return Response(serializer.data)
+    paginator = FollowCursorPagination()
+    links = paginator.paginate_queryset(
+        Follow.objects.filter(follower=request.user).select_related('followee'), request
+    )
+    following = [link.followee for link in links]
+    serializer = UserFollowSerializer(following, many = True, context = {'request': request, 'following_ids': {user.id for user in following}})
+    return paginator.get_paginated_response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -204,7 +219,19 @@ def user_search(request):
     if not query:
         return Response({'error': 'Query parameters "q" is required.'}, status=status.HTTP_400_BAD_REQUEST)
     
-    users = CustomUser.objects.filter(username__icontains=query)[:10]
-    serializer = UserFollowSerializer(users, many = True, context = {'request': request})
+    users = search.search_users(query, limit = 10)
+    following_ids = graph.following_among(request.user, [user.id for user in users])
+    serializer = UserFollowSerializer(users, many = True, context = {'request': request, 'following_ids': following_ids})
+    return Response(serializer.data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def user_autocomplete(request):
+    try:
+        limit = min(max(int(request.query_params.get('limit', 8)), 1), 20)
+    except ValueError:
+        limit = 8
+    users = search.search_users(request.query_params.get('q', ''), limit = limit, substring = False)
+    serializer = UserAutocompleteSerializer(users, many = True)
     return Response(serializer.data)
 
@@ -3,7 +3,8 @@ import os
 
 bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+# ASGI workers so idle notification streams cost a coroutine, not a worker.
+worker_class = "uvicorn.workers.UvicornWorker"
 worker_connections = 1000
 timeout = 30
 keepalive = 2
@@ -1,11 +1,18 @@
 from django.contrib import admin
-from .models import Notification
+from social_media_api.gfk import GenericResolvingChangeList, resolved_target
+from posts.models import Post, Comment
+from .models import Notification, NotificationOutbox
+
+class TargetResolvingChangeList(GenericResolvingChangeList):
+    generic_field = 'target'
+    generic_related = {Post: ['author'], Comment: ['author', 'post']}
 
 # Register your models here.
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('id', 'recipient', 'actor', 'verb', 'read', 'timestamp')
+    list_display = ('id', 'recipient', 'actor', 'verb', 'target_display', 'read', 'timestamp')
     list_filter = ('verb', 'read', 'timestamp')
+    list_select_related = ('recipient', 'actor', 'target_content_type')
     search_fields = ('recipient__username', 'actor__username')
     readonly_fields = ('timestamp',)
     date_hierarchy = 'timestamp'
@@ -18,6 +25,20 @@ class NotificationAdmin(admin.ModelAdmin):
             'fields': ('target_content_type', 'target_object_id')
         }),
         ('Timestamps', {
-            'fields': ('created_at',)
+            'fields': ('timestamp',)
         }),
     )
+
+    @admin.display(description='Target')
+    def target_display(self, obj):
+        return resolved_target(obj, 'target')
+
+    def get_changelist(self, request, **kwargs):
+        return TargetResolvingChangeList
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ('id', 'recipient', 'actor', 'verb', 'attempts', 'available_at', 'created_at')
+    list_filter = ('verb',)
+    search_fields = ('idempotency_key', 'recipient__username', 'actor__username')
+    readonly_fields = ('idempotency_key', 'created_at', 'last_error')
@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from social_media_api.caching import cache_is_shared
+from . import pubsub
+
+# Per-user unread and total notification counts, kept in the cache so the
+# navbar badge is served without touching the database. A missing entry is
+# rebuilt with one aggregate query; writers adjust the cached numbers after
+# their transaction commits. Entries expire after NOTIFICATION_COUNTER_TIMEOUT
+# so any drift from a lost update heals on its own. Every change to a cached
+# unread count is also pushed to the user's live stream.
+#
+# The outbox worker adjusts counts from its own process, so caching them only
+# works with a cache shared by all processes. With a per-process cache
+# (LocMemCache, the default without REDIS_URL) the worker's increments would
+# never reach the web processes, so counts are recounted on every read instead.
+
+
+def unread_key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def total_key(user_id):
+    return f'notifications:total:{user_id}'
+
+
+def timeout():
+    return getattr(settings, 'NOTIFICATION_COUNTER_TIMEOUT', 3600)
+
+
+def cached_counts(user_id):
+    """The cached counts for user_id, or None when either is missing. Never touches the database."""
+    if not cache_is_shared():
+        return None
+    keys = {'unread_count': unread_key(user_id), 'total_count': total_key(user_id)}
+    cached = cache.get_many(keys.values())
+    if len(cached) < len(keys):
+        return None
+    return {name: max(cached[key], 0) for name, key in keys.items()}
+
+
+def get_counts(user):
+    counts = cached_counts(user.id)
+    if counts is not None:
+        return counts
+
+    keys = {'unread_count': unread_key(user.id), 'total_count': total_key(user.id)}
+    counts = user.notifications.aggregate(
+        unread_count = Count('id', filter=~user.notifications.model.read_q(user.notifications_read_through)),
+        total_count = Count('id')
+    )
+    if cache_is_shared():
+        cache.set_many({keys[name]: value for name, value in counts.items()}, timeout())
+    return counts
+
+
+def _incr(key, delta):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # Not cached; the next read recomputes it.
+        return None
+
+
+def adjust(user_id, unread=0, total=0):
+    if not cache_is_shared():
+        return
+
+    def apply():
+        if total:
+            _incr(total_key(user_id), total)
+        if unread:
+            count = _incr(unread_key(user_id), unread)
+            if count is not None:
+                pubsub.publish(user_id, pubsub.unread_count_message(count))
+    transaction.on_commit(apply)
+
+
+def reset_unread(user_id):
+    def apply():
+        if cache_is_shared():
+            cache.set(unread_key(user_id), 0, timeout())
+        pubsub.publish(user_id, pubsub.unread_count_message(0))
+    transaction.on_commit(apply)
+
+
+def invalidate(user_ids):
+    keys = [key for user_id in user_ids for key in (unread_key(user_id), total_key(user_id))]
+    transaction.on_commit(lambda: cache.delete_many(keys))
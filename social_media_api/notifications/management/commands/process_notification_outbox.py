@@ -0,0 +1,40 @@
+import signal
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from notifications import outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued notifications from the notification outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the due events and exit')
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        total = 0
+        while self.running:
+            close_old_connections()
+            delivered, failed = outbox.process_batch(options['batch_size'])
+            total += delivered
+            if delivered or failed:
+                stats = outbox.queue_stats()
+                self.stdout.write(
+                    f'Delivered {delivered}, failed {failed}; '
+                    f'{stats["pending"]} pending, lag {stats["lag_seconds"]}s'
+                )
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Delivered {total} notifications'))
+
+    def stop(self, signum, frame):
+        self.running = False
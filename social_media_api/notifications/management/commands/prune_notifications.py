@@ -0,0 +1,51 @@
+import gzip
+import json
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from notifications import retention
+
+
+class Command(BaseCommand):
+    help = 'Delete (optionally archiving) expired read notifications and notifications over the per-user cap'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Remove read notifications older than this many days (0 disables)')
+        parser.add_argument('--max-per-user', type=int, default=None, help='Keep only this many newest notifications per user (0 disables)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--archive', help='Append removed rows as JSON lines to this file (gzipped if it ends in .gz)')
+
+    def handle(self, *args, **options):
+        days = retention.retention_days() if options['days'] is None else options['days']
+        limit = retention.max_per_user() if options['max_per_user'] is None else options['max_per_user']
+
+        archive_file = None
+        archive = None
+        if options['archive']:
+            opener = gzip.open if options['archive'].endswith('.gz') else open
+            archive_file = opener(options['archive'], 'at', encoding='utf-8')
+
+            def write_archive(rows):
+                archive_file.writelines(json.dumps(row, default=str) + '\n' for row in rows)
+                archive_file.flush()
+            archive = write_archive
+
+        started = time.monotonic()
+        try:
+            expired = 0
+            if days:
+                cutoff = timezone.now() - timedelta(days=days)
+                expired = retention.prune_read(cutoff, options['batch_size'], archive)
+                self.stdout.write(f'Removed {expired} read notifications older than {days} days')
+
+            capped = 0
+            if limit:
+                capped = retention.cap_per_user(limit, options['batch_size'], archive)
+                self.stdout.write(f'Removed {capped} notifications beyond {limit} per user')
+        finally:
+            if archive_file:
+                archive_file.close()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Removed {expired + capped} notifications in {elapsed:.2f}s'))
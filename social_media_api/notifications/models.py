@@ -1,8 +1,11 @@
+import uuid
 from django.db import models
+from django.db.models import F, Q
 from django.conf import settings
 from django.utils import timezone
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from . import counters
 
 # Create your models here.
 class Notification(models.Model):
@@ -28,30 +31,94 @@ class Notification(models.Model):
     target_object_id = models.PositiveIntegerField(null=True, blank=True)
     target = GenericForeignKey('target_content_type', 'target_object_id')
     data = models.JSONField(default=dict, blank=True)
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+
+    # Likes of the same target are folded into one unread row per
+    # NOTIFICATION_COALESCE_WINDOW: actor is the most recent liker,
+    # actor_count counts distinct likers and sample_actors keeps the latest
+    # few for display. actor_ids remembers who was counted, up to
+    # ACTOR_IDS_LIMIT; past that, further likers are counted without checking.
+    COALESCED_VERBS = ('like_post', 'like_comment')
+    SAMPLE_ACTORS_LIMIT = 3
+    ACTOR_IDS_LIMIT = 1000
+    actor_count = models.PositiveIntegerField(default=1)
+    sample_actors = models.JSONField(default=list, blank=True)
+    actor_ids = models.JSONField(default=list, blank=True, editable=False)
 
     class Meta:
         ordering = ['-timestamp']
         indexes = [
             models.Index(fields=['recipient', 'read', 'timestamp']),
+            models.Index(fields=['recipient', 'verb', 'target_object_id']),
+            models.Index(fields=['recipient', '-timestamp', '-id'], name='notification_recent_idx'),
         ]
 
     def __str__(self):
         return f'{self.actor.username} {self.get_verb_display()} for {self.recipient.username}'
 
-    def mark_as_read(self):
+    # A notification is read if it was marked read individually (the read
+    # flag) or is no newer than its recipient's notifications_read_through
+    # watermark, which mark-all-read moves forward with a one-row write.
+
+    @staticmethod
+    def read_q(watermark):
+        """Condition matching read notifications of a recipient with this watermark."""
+        if watermark is None:
+            return Q(read=True)
+        return Q(read=True) | Q(timestamp__lte=watermark)
+
+    @staticmethod
+    def recipient_read_q():
+        """Like read_q, but reads each row's own recipient's watermark (joins the user table)."""
+        return Q(read=True) | Q(timestamp__lte=F('recipient__notifications_read_through'))
+
+    def is_read_for(self, watermark):
+        return self.read or (watermark is not None and self.timestamp <= watermark)
+
+    def mark_as_read(self, watermark=None):
+        if self.is_read_for(watermark):
+            return False
         self.read = True
-        self.save()
+        self.save(update_fields=['read'])
+        counters.adjust(self.recipient_id, unread=-1)
+        return True
 
     def get_message(self):
+        actor = self.actor.username
+        if self.actor_count > 1:
+            others = self.actor_count - 1
+            actor = f'{actor} and {others} other{"s" if others > 1 else ""}'
         messages = {
-            'follow': f'{self.actor.username} started following you',
-            'like_post': f'{self.actor.username} liked your post',
-            'like_comment': f'{self.actor.username} liked your comment',
-            'comment': f'{self.actor.username} commented on your post',
-            'mention': f'{self.actor.username} mentioned you in a post'
+            'follow': f'{actor} started following you',
+            'like_post': f'{actor} liked your post',
+            'like_comment': f'{actor} liked your comment',
+            'comment': f'{actor} commented on your post',
+            'mention': f'{actor} mentioned you in a post'
         }
         return messages.get(self.verb, 'New notification')
 
+    @property
+    def coalesce_key(self):
+        return (self.recipient_id, self.verb, self.target_content_type_id, self.target_object_id)
+
+    def add_actor(self, actor):
+        """Fold another actor into this notification.
+
+        An actor who was already counted is not counted again, which absorbs
+        unlike/re-like toggling. Returns whether the count changed.
+        """
+        if actor.id in self.actor_ids:
+            return False
+        if len(self.actor_ids) < self.ACTOR_IDS_LIMIT:
+            self.actor_ids = self.actor_ids + [actor.id]
+        self.sample_actors = [{'id': actor.id, 'username': actor.username}] + [
+            sample for sample in self.sample_actors if sample['id'] != actor.id
+        ][:self.SAMPLE_ACTORS_LIMIT - 1]
+        self.actor = actor
+        self.actor_count += 1
+        self.timestamp = timezone.now()
+        return True
+
     @classmethod
     def create_notification(cls, recipient, actor, verb, target=None, data=None):
         notification = cls(
@@ -64,5 +131,80 @@ class Notification(models.Model):
             notification.target_content_type = ContentType.objects.get_for_model(target)
             notification.target_object_id = target.id
         notification.save()
+        counters.adjust(recipient.id, unread=1, total=1)
         return notification
 
+
+class NotificationOutbox(models.Model):
+    """A notification waiting to be written by the process_notification_outbox worker.
+
+    Rows are inserted in the same transaction as the follow or like that
+    caused them, so an event is queued if and only if that action commits.
+    """
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    verb = models.CharField(max_length=50)
+    target_content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True)
+    target_object_id = models.PositiveIntegerField(null=True, blank=True)
+    data = models.JSONField(default=dict, blank=True)
+    idempotency_key = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['available_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.verb} for user {self.recipient_id} ({self.idempotency_key})'
+
+    @classmethod
+    def build(cls, recipient, actor, verb, target=None, data=None, key=None):
+        event = cls(
+            recipient = recipient,
+            actor = actor,
+            verb = verb,
+            data = data or {},
+            idempotency_key = key or uuid.uuid4().hex
+        )
+        if target:
+            event.target_content_type = ContentType.objects.get_for_model(target)
+            event.target_object_id = target.id
+        return event
+
+    @classmethod
+    def enqueue(cls, recipient, actor, verb, target=None, data=None, key=None):
+        """Queue a notification; takes the same arguments as Notification.create_notification."""
+        event = cls.build(recipient, actor, verb, target, data, key)
+        event.save()
+        return event
+
+    @classmethod
+    def enqueue_many(cls, entries):
+        """Queue many notifications with one INSERT; entries are dicts of enqueue() arguments."""
+        return cls.objects.bulk_create([cls.build(**entry) for entry in entries])
+
+    def to_notification(self):
+        return Notification(
+            recipient_id = self.recipient_id,
+            actor = self.actor,
+            verb = self.verb,
+            target_content_type_id = self.target_content_type_id,
+            target_object_id = self.target_object_id,
+            data = self.data,
+            idempotency_key = self.idempotency_key,
+            sample_actors = [{'id': self.actor_id, 'username': self.actor.username}] if self.coalesces else [],
+            actor_ids = [self.actor_id] if self.coalesces else []
+        )
+
+    @property
+    def coalesces(self):
+        return self.verb in Notification.COALESCED_VERBS and self.target_object_id is not None
+
+    @property
+    def coalesce_key(self):
+        return (self.recipient_id, self.verb, self.target_content_type_id, self.target_object_id)
@@ -0,0 +1,155 @@
+import logging
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from . import counters, pubsub
+from .models import Notification, NotificationOutbox
+
+# Request handlers only insert NotificationOutbox rows, inside the same
+# transaction as the action that triggered them. The worker below turns those
+# rows into Notification rows in batches. Each outbox row carries an
+# idempotency key that is copied onto the notification, so a batch that is
+# delivered twice (say the worker dies before deleting it) inserts nothing the
+# second time. Likes are coalesced here too: a like whose (recipient, verb,
+# target) already has an unread notification inside the coalesce window
+# updates that row in place instead of adding a new one.
+
+logger = logging.getLogger('social_media_api')
+
+MAX_BACKOFF_SECONDS = 3600
+
+
+def batch_size():
+    return getattr(settings, 'NOTIFICATION_OUTBOX_BATCH_SIZE', 500)
+
+
+def max_attempts():
+    return getattr(settings, 'NOTIFICATION_OUTBOX_MAX_ATTEMPTS', 8)
+
+
+def pending():
+    """Events that still have delivery attempts left."""
+    return NotificationOutbox.objects.filter(attempts__lt=max_attempts())
+
+
+def dead_letters():
+    return NotificationOutbox.objects.filter(attempts__gte=max_attempts())
+
+
+def coalesce_window():
+    return timedelta(seconds=getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', 86400))
+
+
+def open_notifications(keys):
+    """The newest unread, still-in-window notification for each coalesce key, locked for update."""
+    keys = set(keys)
+    candidates = Notification.objects.select_for_update(of=('self',)).exclude(
+        Notification.recipient_read_q()
+    ).filter(
+        timestamp__gte = timezone.now() - coalesce_window(),
+        verb__in = {key[1] for key in keys},
+        recipient_id__in = {key[0] for key in keys},
+        target_object_id__in = {key[3] for key in keys}
+    ).order_by('timestamp')
+    return {row.coalesce_key: row for row in candidates if row.coalesce_key in keys}
+
+
+def deliver(events):
+    """Write events as notifications, folding coalescible ones into open rows."""
+    created, groups = [], {}
+    for event in events:
+        if event.coalesces:
+            groups.setdefault(event.coalesce_key, []).append(event)
+        else:
+            created.append(event.to_notification())
+
+    updated = []
+    existing = open_notifications(groups) if groups else {}
+    for key, group in groups.items():
+        row = existing.get(key)
+        if row is None:
+            row = group[0].to_notification()
+            group = group[1:]
+            created.append(row)
+        else:
+            updated.append(row)
+        for event in group:
+            row.add_actor(event.actor)
+
+    # Skip events that were already delivered (their key is taken) instead of
+    # relying on ignore_conflicts, so the inserted rows get their ids back.
+    delivered_keys = set(
+        Notification.objects.filter(idempotency_key__in=[row.idempotency_key for row in created])
+        .values_list('idempotency_key', flat=True)
+    )
+    created = Notification.objects.bulk_create(
+        [row for row in created if row.idempotency_key not in delivered_keys]
+    )
+    for recipient_id, added in Counter(row.recipient_id for row in created).items():
+        counters.adjust(recipient_id, unread=added, total=added)
+    if updated:
+        Notification.objects.bulk_update(updated, ['actor', 'actor_count', 'sample_actors', 'actor_ids', 'timestamp'])
+    for row in created + updated:
+        pubsub.publish_on_commit(row.recipient_id, pubsub.notification_message(row))
+    return created, updated
+
+
+def _deliver_each(events, now):
+    """Retry a failed batch one event at a time so one bad event cannot hold up the rest."""
+    delivered, failed = [], []
+    for event in events:
+        try:
+            with transaction.atomic():
+                deliver([event])
+        except Exception as exc:
+            event.attempts += 1
+            event.last_error = repr(exc)
+            event.available_at = now + timedelta(seconds=min(2 ** event.attempts, MAX_BACKOFF_SECONDS))
+            failed.append(event)
+            logger.warning('Notification outbox event %s failed (attempt %s): %r', event.id, event.attempts, exc)
+        else:
+            delivered.append(event)
+    if failed:
+        NotificationOutbox.objects.bulk_update(failed, ['attempts', 'last_error', 'available_at'])
+    return delivered, failed
+
+
+def process_batch(size=None):
+    """Deliver one batch of due events. Returns (delivered, failed) counts."""
+    now = timezone.now()
+    with transaction.atomic():
+        # skip_locked lets several workers drain the queue side by side on
+        # databases that support it; elsewhere the lock is simply not taken.
+        events = list(
+            pending().select_related('actor').select_for_update(skip_locked=True, of=('self',))
+            .filter(available_at__lte=now)
+            .order_by('available_at', 'id')[:size or batch_size()]
+        )
+        if not events:
+            return 0, 0
+
+        try:
+            with transaction.atomic():
+                deliver(events)
+            delivered, failed = events, []
+        except Exception:
+            delivered, failed = _deliver_each(events, now)
+
+        NotificationOutbox.objects.filter(id__in=[event.id for event in delivered]).delete()
+    return len(delivered), len(failed)
+
+
+def queue_stats():
+    """Backlog size and how long the oldest due event has been waiting."""
+    now = timezone.now()
+    oldest = (
+        pending().filter(available_at__lte=now)
+        .order_by('available_at').values_list('available_at', flat=True).first()
+    )
+    return {
+        'pending': pending().count(),
+        'dead': dead_letters().count(),
+        'lag_seconds': round((now - oldest).total_seconds(), 3) if oldest else 0,
+    }
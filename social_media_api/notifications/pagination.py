@@ -1,5 +1,6 @@
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from posts.pagination import KeysetPagination
 
 class NotificationPagination(PageNumberPagination):
     page_size = 20
@@ -17,4 +18,8 @@ class NotificationPagination(PageNumberPagination):
             'total_pages': self.page.paginator.num_pages,
             'current_page': self.page.number,
             'results': data
-        })
\ No newline at end of file
+        })
+
+class NotificationCursorPagination(KeysetPagination):
+    page_size = 20
+    ordering = '-timestamp'
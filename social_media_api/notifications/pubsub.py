@@ -0,0 +1,160 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+
+# Live notification events for the SSE stream. Publishers are ordinary sync
+# code (the outbox worker, views); subscribers are stream connections running
+# on an event loop. Each stream gets a bounded queue; a client that falls too
+# far behind loses events but resynchronises from its next unread count.
+
+logger = logging.getLogger('social_media_api')
+
+QUEUE_SIZE = 100
+
+
+def channel(user_id):
+    return f'notifications:{user_id}'
+
+
+class Subscription:
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+    async def close(self):
+        await self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Fans messages out to subscribers in this process only.
+
+    Enough for tests and a single-process server; use RedisBroker when the
+    publisher (e.g. the outbox worker) runs in a different process.
+    """
+
+    def __init__(self):
+        self.subscriptions = defaultdict(set)
+        self.lock = threading.Lock()
+
+    async def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self.lock:
+            self.subscriptions[channel].add(subscription)
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscriptions.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscriptions[subscription.channel]
+
+    def deliver(self, channel, message):
+        with self.lock:
+            subscribers = list(self.subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, message)
+            except RuntimeError:
+                # The subscriber's loop has shut down.
+                pass
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+
+class RedisBroker(InProcessBroker):
+    """Relays messages through Redis pub/sub so every server process sees them.
+
+    Each process holds one subscriber connection and subscribes it only to the
+    channels of users connected to that process, then fans out locally.
+    """
+
+    def __init__(self, url):
+        super().__init__()
+        import redis
+        self.url = url
+        self.publisher = redis.Redis.from_url(url)
+        self.pubsub = None
+        self.reader = None
+
+    async def subscribe(self, channel):
+        if self.pubsub is None:
+            import redis.asyncio
+            self.pubsub = redis.asyncio.Redis.from_url(self.url).pubsub(ignore_subscribe_messages=True)
+        if channel not in self.subscriptions:
+            await self.pubsub.subscribe(channel)
+        # listen() returns once nothing is subscribed, so restart it as needed.
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.create_task(self.read())
+        return await super().subscribe(channel)
+
+    async def unsubscribe(self, subscription):
+        await super().unsubscribe(subscription)
+        if subscription.channel not in self.subscriptions:
+            await self.pubsub.unsubscribe(subscription.channel)
+
+    async def read(self):
+        async for message in self.pubsub.listen():
+            if message['type'] == 'message':
+                self.deliver(message['channel'].decode(), json.loads(message['data']))
+
+    def publish(self, channel, message):
+        self.publisher.publish(channel, json.dumps(message))
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        if getattr(settings, 'NOTIFICATION_BROKER', 'memory') == 'redis':
+            _broker = RedisBroker(settings.REDIS_URL)
+        else:
+            _broker = InProcessBroker()
+    return _broker
+
+
+def publish(user_id, message):
+    try:
+        get_broker().publish(channel(user_id), message)
+    except Exception:
+        # Live updates are best effort; clients resync from their next unread count.
+        logger.warning('Could not publish notification event for user %s', user_id, exc_info=True)
+
+
+def publish_on_commit(user_id, message):
+    transaction.on_commit(lambda: publish(user_id, message))
+
+
+def unread_count_message(count):
+    return {'type': 'unread_count', 'unread_count': max(count, 0)}
+
+
+def notification_message(notification):
+    return {
+        'type': 'notification',
+        'id': notification.id,
+        'verb': notification.verb,
+        'message': notification.get_message(),
+        'actor_count': notification.actor_count,
+        'target_id': notification.target_object_id,
+        'created_at': notification.timestamp.isoformat() if notification.timestamp else None,
+    }
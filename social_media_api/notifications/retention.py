@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.db.models import Count, Max, Min, Q
+from . import counters
+from .models import Notification
+
+# Retention runs in small batches so no single DELETE holds locks for long:
+# expired read notifications are removed one primary-key window at a time,
+# and per-user caps delete at most batch_size rows per statement. Callers may
+# pass an archive callable that receives each batch as dicts before deletion.
+
+ARCHIVE_FIELDS = [
+    'id', 'recipient_id', 'actor_id', 'verb', 'read', 'timestamp',
+    'target_content_type_id', 'target_object_id', 'data', 'actor_count', 'sample_actors',
+]
+
+
+def retention_days():
+    return getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90)
+
+
+def max_per_user():
+    return getattr(settings, 'NOTIFICATION_MAX_PER_USER', 1000)
+
+
+def _delete(queryset, archive):
+    fields = ARCHIVE_FIELDS if archive else ['id', 'recipient_id']
+    rows = list(queryset.values(*fields))
+    if not rows:
+        return 0
+    if archive:
+        archive(rows)
+    Notification.objects.filter(id__in=[row['id'] for row in rows]).delete()
+    counters.invalidate({row['recipient_id'] for row in rows})
+    return len(rows)
+
+
+def prune_read(cutoff, batch_size=5000, archive=None):
+    """Delete read notifications older than cutoff, one id window at a time."""
+    bounds = Notification.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return 0
+
+    removed = 0
+    for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+        removed += _delete(
+            Notification.objects.filter(
+                Notification.recipient_read_q(),
+                id__gte = start,
+                id__lt = start + batch_size,
+                timestamp__lt = cutoff
+            ),
+            archive
+        )
+    return removed
+
+
+def over_limit_recipients(limit):
+    return (
+        Notification.objects.values('recipient_id')
+        .annotate(total=Count('id')).filter(total__gt=limit)
+        .values_list('recipient_id', flat=True)
+    )
+
+
+def cap_user(recipient_id, limit, batch_size=5000, archive=None):
+    """Delete everything but recipient's newest limit notifications."""
+    notifications = Notification.objects.filter(recipient_id=recipient_id)
+    boundary = notifications.order_by('-timestamp', '-id').values('timestamp', 'id')[limit - 1:limit].first()
+    if boundary is None:
+        return 0
+
+    older = notifications.filter(
+        Q(timestamp__lt=boundary['timestamp']) |
+        Q(timestamp=boundary['timestamp'], id__lt=boundary['id'])
+    ).order_by('id')
+    removed = 0
+    while True:
+        deleted = _delete(older[:batch_size], archive)
+        removed += deleted
+        if deleted < batch_size:
+            return removed
+
+
+def cap_per_user(limit, batch_size=5000, archive=None):
+    return sum(
+        cap_user(recipient_id, limit, batch_size, archive)
+        for recipient_id in list(over_limit_recipients(limit))
+    )
@@ -1,24 +1,62 @@
 from .models import Notification
+from django.utils.text import Truncator
 from rest_framework import serializers
+from accounts.models import CustomUser
 from accounts.serializers import UserProfileSerializer
+from posts.models import Post, Comment
+from social_media_api.gfk import resolve_generic, resolved_target
+
+TARGET_RELATED = {Comment: ['post']}
+
+def summarize_target(target):
+    if isinstance(target, Post):
+        return {'title': target.title}
+    if isinstance(target, Comment):
+        return {
+            'excerpt': Truncator(target.content).chars(80),
+            'post_id': target.post_id,
+            'post_title': target.post.title
+        }
+    if isinstance(target, CustomUser):
+        return {'username': target.username}
+    return {}
+
+class NotificationListSerializer(serializers.ListSerializer):
+    """Loads every target on the page with one query per target type."""
+
+    def to_representation(self, data):
+        items = resolve_generic(data.all() if hasattr(data, 'all') else data, 'target', TARGET_RELATED)
+        return super().to_representation(items)
 
 class NotificationSerializer(serializers.ModelSerializer):
     actor = UserProfileSerializer(read_only=True)
     message = serializers.SerializerMethodField()
     target_type = serializers.SerializerMethodField()
     target_id = serializers.SerializerMethodField()
+    created_at = serializers.DateTimeField(source='timestamp', read_only=True)
+    read = serializers.SerializerMethodField()
+    target = serializers.SerializerMethodField()
 
     class Meta:
         model = Notification
+        list_serializer_class = NotificationListSerializer
         fields = [
-            'id', 'actor', 'verb', 'message', 'target_type', 'target_id',
-            'data', 'read', 'created_at'
+            'id', 'actor', 'actor_count', 'sample_actors', 'verb', 'message',
+            'target_type', 'target_id', 'target', 'data', 'read', 'created_at'
         ]
         read_only_fields = fields
 
     def get_message(self, obj):
         return obj.get_message()
 
+    def get_read(self, obj):
+        request = self.context.get('request')
+        if request is not None and request.user.id == obj.recipient_id:
+            recipient = request.user
+        else:
+            recipient = obj.recipient
+        return obj.is_read_for(recipient.notifications_read_through)
+
     def get_target_type(self, obj):
         if obj.target_content_type:
             return obj.target_content_type.model
@@ -27,6 +65,12 @@ class NotificationSerializer(serializers.ModelSerializer):
     def get_target_id(self, obj):
         return obj.target_object_id
 
+    def get_target(self, obj):
+        target = resolved_target(obj, 'target')
+        if target is None:
+            return None
+        return {'type': obj.target_content_type.model, 'id': target.pk, **summarize_target(target)}
+
 class NotificationUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
@@ -1,3 +1,309 @@
-from django.test import TestCase
+from django.core.cache import cache
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.core import signing
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from accounts.models import CustomUser
+from posts.models import Post
+from .models import Notification, NotificationOutbox
+from . import counters, outbox, retention, views
 
-# Create your tests here.
+
+def make_user(username):
+    return CustomUser.objects.create_user(username=username, email=f'{username}@example.com', password='password')
+
+
+# Counters are only cached when every process shares the cache (see notifications.counters).
+shared_cache = override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': tempfile.mkdtemp(prefix='notifications-tests-'),
+}})
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.author = make_user('author')
+        self.fan = make_user('fan')
+        self.post = Post.objects.create(author=self.author, title='Title', content='Content')
+
+    def test_process_batch_delivers_and_drains(self):
+        NotificationOutbox.enqueue(recipient=self.author, actor=self.fan, verb='follow')
+        self.assertEqual(Notification.objects.count(), 0)
+        self.assertEqual(outbox.process_batch(), (1, 0))
+        self.assertEqual(outbox.process_batch(), (0, 0))
+        notification = Notification.objects.get()
+        self.assertEqual((notification.recipient, notification.actor, notification.verb), (self.author, self.fan, 'follow'))
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    @shared_cache
+    def test_redelivered_events_are_written_once(self):
+        events = [
+            NotificationOutbox.enqueue(recipient=self.author, actor=self.fan, verb='follow'),
+            NotificationOutbox.enqueue(recipient=self.author, actor=self.fan, verb='comment', target=self.post),
+        ]
+        cache.clear()
+        counters.get_counts(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            outbox.deliver(events)
+        # As if the worker died after delivering but before deleting the batch.
+        with self.captureOnCommitCallbacks(execute=True):
+            created, _ = outbox.deliver(list(NotificationOutbox.objects.select_related('actor')))
+        self.assertEqual(created, [])
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(counters.get_counts(self.author), {'unread_count': 2, 'total_count': 2})
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('reader')
+        self.fan = make_user('fan')
+
+    def deliver(self, verb='follow'):
+        with self.captureOnCommitCallbacks(execute=True):
+            outbox.deliver([NotificationOutbox.enqueue(recipient=self.user, actor=self.fan, verb=verb)])
+
+    def test_per_process_cache_recounts_every_read(self):
+        # The outbox worker's increments would land in its own LocMemCache.
+        self.assertEqual(counters.get_counts(self.user), {'unread_count': 0, 'total_count': 0})
+        self.deliver()
+        self.assertIsNone(counters.cached_counts(self.user.id))
+        self.assertEqual(counters.get_counts(self.user), {'unread_count': 1, 'total_count': 1})
+
+    @shared_cache
+    def test_shared_cache_is_adjusted_in_place(self):
+        cache.clear()
+        counters.get_counts(self.user)
+        self.deliver()
+        self.deliver('comment')
+        self.assertEqual(counters.cached_counts(self.user.id), {'unread_count': 2, 'total_count': 2})
+        with self.assertNumQueries(0):
+            self.assertEqual(counters.get_counts(self.user), {'unread_count': 2, 'total_count': 2})
+
+
+class CoalescingTests(TestCase):
+    def setUp(self):
+        self.author = make_user('author')
+        self.post = Post.objects.create(author=self.author, title='Title', content='Content')
+
+    def like(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post(f'/api/likes/post/{self.post.id}/').data['liked']
+
+    def test_likes_fold_into_one_notification_counting_distinct_likers(self):
+        likers = [make_user(f'liker{i}') for i in range(4)]
+        for user in likers:
+            self.like(user)
+        # liker0 is no longer in the 3-actor sample, but must not be counted twice.
+        self.assertFalse(self.like(likers[0]))
+        self.assertTrue(self.like(likers[0]))
+        outbox.process_batch()
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 4)
+        self.assertEqual([sample['id'] for sample in notification.sample_actors], [likers[3].id, likers[2].id, likers[1].id])
+        self.assertEqual(notification.get_message(), 'liker3 and 3 others liked your post')
+
+
+class NotificationListTests(TestCase):
+    def setUp(self):
+        self.user = make_user('reader')
+        self.actor = make_user('actor')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def notify_about_post(self):
+        post = Post.objects.create(author=self.user, title='Title', content='Content')
+        Notification.objects.create(recipient=self.user, actor=self.actor, verb='like_post', target=post)
+        return post
+
+    def list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/notifications/api/notifications/')
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_deleted_targets_are_not_queried_one_by_one(self):
+        self.notify_about_post()
+        self.notify_about_post().delete()
+        response, baseline = self.list_queries()
+        self.assertEqual(sorted(item['target'] is None for item in response.data['results']), [False, True])
+
+        for _ in range(3):
+            self.notify_about_post().delete()
+        response, queries = self.list_queries()
+        self.assertEqual(sum(item['target'] is None for item in response.data['results']), 4)
+        self.assertEqual(queries, baseline)
+
+
+class ReadWatermarkTests(TestCase):
+    def setUp(self):
+        self.user = make_user('reader')
+        self.actor = make_user('actor')
+        self.post = Post.objects.create(author=self.user, title='Title', content='Content')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def notify(self, count):
+        Notification.objects.bulk_create([
+            Notification(recipient=self.user, actor=self.actor, verb='follow') for _ in range(count)
+        ])
+
+    def mark_all_read(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/notifications/api/notifications/mark_all_read/')
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def unread_count(self):
+        return self.client.get('/notifications/api/notifications/count/').data['unread_count']
+
+    def test_mark_all_read_moves_the_watermark(self):
+        self.notify(2)
+        response, few = self.mark_all_read()
+        self.assertEqual(response.data['message'], 'Marked 2 notifications as read')
+        self.user.refresh_from_db()
+        first = self.user.notifications_read_through
+        self.assertIsNotNone(first)
+        self.assertFalse(Notification.objects.filter(read=True).exists())
+        self.assertEqual(self.unread_count(), 0)
+
+        self.notify(20)
+        self.assertEqual(self.unread_count(), 20)
+        response, many = self.mark_all_read()
+        self.user.refresh_from_db()
+        self.assertGreater(self.user.notifications_read_through, first)
+        self.assertEqual(self.unread_count(), 0)
+        self.assertEqual(self.client.get('/notifications/api/notifications/unread/').data['results'], [])
+        # One watermark write, however many notifications it covers.
+        self.assertEqual(few, many)
+
+    def test_marking_one_below_the_watermark_is_a_no_op(self):
+        self.notify(1)
+        self.mark_all_read()
+        notification = Notification.objects.get()
+        self.client.post(f'/notifications/api/notifications/{notification.id}/mark_read/')
+        notification.refresh_from_db()
+        self.assertFalse(notification.read)
+        self.assertTrue(self.client.get(f'/notifications/api/notifications/{notification.id}/').data['read'])
+
+    def test_coalescing_skips_rows_at_or_below_the_watermark(self):
+        notification = Notification.objects.create(recipient=self.user, actor=self.actor, verb='like_post', target=self.post)
+        key = notification.coalesce_key
+        self.assertEqual(list(outbox.open_notifications([key])), [key])
+
+        CustomUser.objects.filter(id=self.user.id).update(notifications_read_through=notification.timestamp)
+        with self.assertNumQueries(1):
+            self.assertEqual(outbox.open_notifications([key]), {})
+
+        # The next like starts a new unread row instead of reviving the read one.
+        NotificationOutbox.enqueue(recipient=self.user, actor=make_user('fan'), verb='like_post', target=self.post)
+        outbox.process_batch()
+        self.assertEqual(Notification.objects.count(), 2)
+        notification.refresh_from_db()
+        self.assertEqual(notification.actor_count, 1)
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.user = make_user('reader')
+        self.actor = make_user('actor')
+        self.now = timezone.now()
+        self.cutoff = self.now - timedelta(days=30)
+
+    def notify(self, days_ago, read=False):
+        notification = Notification.objects.create(recipient=self.user, actor=self.actor, verb='follow', read=read)
+        Notification.objects.filter(id=notification.id).update(timestamp=self.now - timedelta(days=days_ago))
+        return notification.id
+
+    def test_prune_read_removes_only_old_read_notifications(self):
+        self.notify(60, read=True)
+        old_unread = self.notify(45)
+        new_read = self.notify(1, read=True)
+        self.assertEqual(retention.prune_read(self.cutoff), 1)
+        self.assertCountEqual(Notification.objects.values_list('id', flat=True), [old_unread, new_read])
+
+        # Marking all read moves the watermark past old_unread, which then expires too.
+        CustomUser.objects.filter(id=self.user.id).update(notifications_read_through=self.now - timedelta(days=40))
+        self.assertEqual(retention.prune_read(self.cutoff), 1)
+        self.assertEqual(list(Notification.objects.values_list('id', flat=True)), [new_read])
+
+    def test_rows_are_archived_before_they_are_deleted(self):
+        expired = [self.notify(60, read=True) for _ in range(3)]
+        archived = []
+
+        def archive(rows):
+            # Still present: a failed archive must not lose rows.
+            self.assertEqual(Notification.objects.filter(id__in=[row['id'] for row in rows]).count(), len(rows))
+            archived.extend(rows)
+
+        self.assertEqual(retention.prune_read(self.cutoff, archive=archive), 3)
+        self.assertEqual([row['id'] for row in archived], expired)
+        self.assertEqual(set(archived[0]), set(retention.ARCHIVE_FIELDS))
+        self.assertFalse(Notification.objects.exists())
+
+    def test_prune_read_walks_id_windows(self):
+        ids = [self.notify(60, read=True) for _ in range(5)]
+        self.notify(1, read=True)
+        batches = []
+        self.assertEqual(retention.prune_read(self.cutoff, batch_size=2, archive=lambda rows: batches.append([row['id'] for row in rows])), 5)
+        self.assertEqual(batches, [ids[0:2], ids[2:4], ids[4:5]])
+        self.assertEqual(Notification.objects.count(), 1)
+
+
+class StreamAuthTests(TestCase):
+    def setUp(self):
+        self.user = make_user('reader')
+        self.token = Token.objects.create(user=self.user)
+        self.factory = RequestFactory()
+
+    def ticket(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = client.post('/notifications/api/stream/ticket/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['ticket']
+
+    def stream_user(self, **params):
+        return views.stream_user(self.factory.get('/notifications/api/stream/', params))
+
+    def test_ticket_opens_the_stream(self):
+        self.assertEqual(self.stream_user(ticket=self.ticket()), self.user)
+
+    def test_api_token_is_not_accepted_in_the_url(self):
+        self.assertIsNone(self.stream_user(token=self.token.key))
+        self.assertNotIn(self.token.key, self.ticket())
+
+    def test_expired_or_forged_tickets_are_rejected(self):
+        ticket = self.ticket()
+        with mock.patch('django.core.signing.time.time', return_value=signing.time.time() + 61):
+            self.assertIsNone(self.stream_user(ticket=ticket))
+        self.assertIsNone(self.stream_user(ticket=signing.TimestampSigner().sign(str(self.user.id))))
+
+    def test_ticket_requires_authentication(self):
+        self.assertEqual(APIClient().post('/notifications/api/stream/ticket/').status_code, 401)
+
+
+class StreamTests(TestCase):
+    @shared_cache
+    @override_settings(NOTIFICATION_STREAM_HEARTBEAT=0.01)
+    async def test_heartbeat_reads_counts_from_the_cache(self):
+        cache.clear()
+        user = await CustomUser.objects.acreate(username='reader', email='reader@example.com')
+        await cache.aset_many({counters.unread_key(user.id): 2, counters.total_key(user.id): 5})
+        with mock.patch.object(counters, 'get_counts', wraps=counters.get_counts) as get_counts:
+            stream = views.stream_events(user)
+            self.assertTrue((await anext(stream)).startswith('retry:'))
+            self.assertIn('"unread_count": 2', await anext(stream))
+            self.assertEqual(await anext(stream), ': keep-alive\n\n')
+            await cache.aset(counters.unread_key(user.id), 3)
+            self.assertIn('"unread_count": 3', await anext(stream))
+            await stream.aclose()
+        # Only the opening count goes through get_counts; heartbeats hit the cache alone.
+        self.assertEqual(get_counts.call_count, 1)
@@ -9,5 +9,7 @@ urlpatterns = [
     path('', views.notifications_view, name='notifications'),
 
     path('api/', include(router.urls)),
-    path('api/stats/', views.notification_stats, name='notification_stats')
+    path('api/stats/', views.notification_stats, name='notification_stats'),
+    path('api/stream/', views.notification_stream, name='notification_stream'),
+    path('api/stream/ticket/', views.stream_ticket, name='notification_stream_ticket')
 ]
@@ -1,12 +1,24 @@
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from django.db.models import Count, Q
+from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from .models import Notification
+from . import counters, pubsub
 from .serializers import NotificationSerializer, NotificationUpdateSerializer, NotificationCountSerializer
-from .pagination import NotificationPagination
+from .pagination import NotificationPagination, NotificationCursorPagination
+from posts.pagination import CursorSelectableMixin
+from accounts import authentication
+from accounts.models import CustomUser
 
 
 # Create your views here.
@@ -14,22 +26,23 @@ from .pagination import NotificationPagination
 def notifications_view(request):
     return render(request, 'notifications/notifications.html')
 
-class NotificationViewSet(viewsets.ModelViewSet):
+class NotificationViewSet(CursorSelectableMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = NotificationSerializer
     pagination_class = NotificationPagination
+    cursor_pagination_class = NotificationCursorPagination
 
     def get_queryset(self):
-        return Notification.objects.filter(recipient=self.request.user)
+        return Notification.objects.filter(recipient=self.request.user).select_related('actor', 'target_content_type')
 
     def list(self, request):
         queryset = self.get_queryset()
         read_status = self.request.query_params.get('read', None)
         if read_status is not None:
             if read_status.lower() == 'true':
-                queryset = queryset.filter(read=True)
+                queryset = queryset.filter(self.read_q())
             elif read_status.lower() == 'false':
-                queryset = queryset.filter(read=False)
+                queryset = queryset.exclude(self.read_q())
 
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -39,31 +52,37 @@ class NotificationViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    def read_q(self):
+        return Notification.read_q(self.request.user.notifications_read_through)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        was_read = instance.is_read_for(self.request.user.notifications_read_through)
+        counters.adjust(instance.recipient_id, unread=0 if was_read else -1, total=-1)
+
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         notification = self.get_object()
-        notification.mark_as_read()
+        notification.mark_as_read(request.user.notifications_read_through)
         return Response({'message': 'Notification marked as read'})
 
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
-        updated_count = self.get_queryset().filter(read=False).update(read=True)
+        # Moving the watermark is a single-row write however many rows it covers.
+        updated_count = counters.get_counts(request.user)['unread_count']
+        request.user.notifications_read_through = timezone.now()
+        request.user.save(update_fields=['notifications_read_through'])
+        counters.reset_unread(request.user.id)
         return Response({'message': f'Marked {updated_count} notifications as read'})
 
     @action(detail=False, methods=['get'])
     def count(self, request):
-        total_count = self.get_queryset().count()
-        unread_count = self.get_queryset().filter(read=False).count()
-
-        serializer = NotificationCountSerializer({
-            'unread_count': unread_count,
-            'total_count': total_count
-        })
+        serializer = NotificationCountSerializer(counters.get_counts(request.user))
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def unread(self, request):
-        unread_notifications = self.get_queryset().filter(read=False)
+        unread_notifications = self.get_queryset().exclude(self.read_q())
         
         page = self.paginate_queryset(unread_notifications)
         if page is not None:
@@ -76,18 +95,100 @@ class NotificationViewSet(viewsets.ModelViewSet):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def notification_stats(request):
-    notifications = Notification.objects.filter(recipient=request.user)
+    verbs = ['follow', 'like_post', 'like_comment', 'comment', 'mention']
+    counts = Notification.objects.filter(recipient=request.user).aggregate(
+        total = Count('id'),
+        unread = Count('id', filter=~Notification.read_q(request.user.notifications_read_through)),
+        **{verb: Count('id', filter=Q(verb=verb)) for verb in verbs}
+    )
 
     stats = {
-        'total': notifications.count(),
-        'unread': notifications.filter(read=False).count(),
-        'read': notifications.filter(read=True).count(),
-        'types': {
-            'follow': notifications.filter(verb='follow').count(),
-            'like_post': notifications.filter(verb='like_post').count(),
-            'like_comment': notifications.filter(verb='like_comment').count(),
-            'comment': notifications.filter(verb='comment').count(),
-            'mention': notifications.filter(verb='mention').count(),
-        }
+        'total': counts['total'],
+        'unread': counts['unread'],
+        'read': counts['total'] - counts['unread'],
+        'types': {verb: counts[verb] for verb in verbs}
     }
     return Response(stats)
+
+STREAM_TICKET_SALT = 'notifications.stream'
+
+def stream_ticket_max_age():
+    return getattr(settings, 'NOTIFICATION_STREAM_TICKET_MAX_AGE', 60)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def stream_ticket(request):
+    """A short-lived ticket for ?ticket= on the stream.
+
+    EventSource cannot send headers, and an API token in the URL would end up
+    in access logs; a ticket only opens the stream and expires quickly.
+    """
+    ticket = signing.TimestampSigner(salt=STREAM_TICKET_SALT).sign(str(request.user.id))
+    return Response({'ticket': ticket, 'expires_in': stream_ticket_max_age()})
+
+def stream_user(request):
+    """The user for a stream request: a ticket from ?ticket=, the Authorization header, or the session."""
+    ticket = request.GET.get('ticket')
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if ticket:
+        try:
+            user_id = signing.TimestampSigner(salt=STREAM_TICKET_SALT).unsign(ticket, max_age=stream_ticket_max_age())
+        except signing.BadSignature:
+            return None
+        user = CustomUser.objects.filter(id=user_id).first()
+    elif header.startswith('Token '):
+        token = authentication.cached_token(header[len('Token '):].strip())
+        user = token.user if token else None
+    else:
+        user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated or not user.is_active:
+        return None
+    return user
+
+def sse(message):
+    return f'event: {message["type"]}\ndata: {json.dumps(message)}\n\n'
+
+async def stream_events(user):
+    heartbeat = getattr(settings, 'NOTIFICATION_STREAM_HEARTBEAT', 20)
+    max_age = getattr(settings, 'NOTIFICATION_STREAM_MAX_AGE', 300)
+    loop = asyncio.get_running_loop()
+    closes_at = loop.time() + max_age
+
+    subscription = await pubsub.get_broker().subscribe(pubsub.channel(user.id))
+    try:
+        unread = (await sync_to_async(counters.get_counts)(user))['unread_count']
+        yield f'retry: {heartbeat * 1000}\n'
+        yield sse(pubsub.unread_count_message(unread))
+
+        # Streams end after max_age and the browser reconnects, so a stream
+        # whose client disconnected without being noticed is not held forever.
+        while loop.time() < closes_at:
+            try:
+                message = await asyncio.wait_for(subscription.get(), min(heartbeat, closes_at - loop.time()))
+            except asyncio.TimeoutError:
+                # Re-reading the counter keeps its cache entry warm and repairs missed updates.
+                # The cache read runs off the thread that serves sync views, so
+                # thousands of idle streams cannot queue up in front of requests;
+                # only a cache miss recounts there.
+                counts = await sync_to_async(counters.cached_counts, thread_sensitive=False)(user.id)
+                if counts is None:
+                    counts = await sync_to_async(counters.get_counts)(user)
+                if counts['unread_count'] == unread:
+                    yield ': keep-alive\n\n'
+                    continue
+                message = pubsub.unread_count_message(counts['unread_count'])
+            if message['type'] == 'unread_count':
+                unread = message['unread_count']
+            yield sse(message)
+    finally:
+        await subscription.close()
+
+async def notification_stream(request):
+    user = await sync_to_async(stream_user)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    response = StreamingHttpResponse(stream_events(user), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
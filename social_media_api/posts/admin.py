@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Post, Comment
+from social_media_api.gfk import GenericResolvingChangeList, resolved_target
+from .models import Post, Comment, Like
 
 # Register your models here.
 @admin.register(Post)
@@ -21,3 +22,22 @@ class CommentAdmin(admin.ModelAdmin):
     def truncated_content(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content 
     truncated_content.short_description = 'Content'
+
+class LikeChangeList(GenericResolvingChangeList):
+    generic_field = 'content_object'
+    generic_related = {Post: ['author'], Comment: ['author', 'post']}
+
+@admin.register(Like)
+class LikeAdmin(admin.ModelAdmin):
+    list_display = ('like_display', 'user', 'content_type', 'created_at')
+    list_filter = ('content_type', 'created_at')
+    list_select_related = ('user', 'content_type')
+    search_fields = ('user__username',)
+    date_hierarchy = 'created_at'
+
+    @admin.display(description='Like')
+    def like_display(self, obj):
+        return f'{obj.user.username} liked {resolved_target(obj, "content_object")}'
+
+    def get_changelist(self, request, **kwargs):
+        return LikeChangeList
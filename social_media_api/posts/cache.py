@@ -0,0 +1,103 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+# Anonymous post responses are cached under keys that embed a content
+# version. Writes never delete cache entries; they bump the version instead,
+# so every entry rendered before the write simply stops being addressable.
+# The list version covers every post; each post also has its own version
+# for the detail view.
+
+GLOBAL_VERSION_KEY = 'posts:version'
+HITS_KEY = 'posts:cache:hits'
+MISSES_KEY = 'posts:cache:misses'
+
+
+def post_version_key(post_id):
+    return f'posts:version:{post_id}'
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock rather than 1 so a version key that was evicted
+        # can never come back with a number an older entry was stored under.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def bump_versions(post_ids=()):
+    bump_version(GLOBAL_VERSION_KEY)
+    for post_id in post_ids:
+        bump_version(post_version_key(post_id))
+
+
+def count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def cache_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
+
+
+def response_key(request, action, version):
+    params = sorted((key, value) for key, values in request.query_params.lists() for value in values)
+    digest = hashlib.md5(f'{request.get_host()}{request.path}?{urlencode(params)}'.encode()).hexdigest()
+    return f'posts:response:{action}:{version}:{digest}'
+
+
+class AnonymousResponseCacheMixin:
+    """Serve list/retrieve to anonymous users from the versioned response cache."""
+
+    def cached_response(self, request, action, version_key, render):
+        if request.user.is_authenticated:
+            return render()
+
+        key = response_key(request, action, get_version(version_key))
+        data = cache.get(key)
+        if data is not None:
+            count(HITS_KEY)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        count(MISSES_KEY)
+        response = render()
+        if response.status_code == 200:
+            cache.set(key, response.data, getattr(settings, 'POST_RESPONSE_CACHE_TIMEOUT', 300))
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, 'list', GLOBAL_VERSION_KEY,
+            lambda: super(AnonymousResponseCacheMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, 'retrieve', post_version_key(kwargs.get(self.lookup_url_kwarg or self.lookup_field)),
+            lambda: super(AnonymousResponseCacheMixin, self).retrieve(request, *args, **kwargs)
+        )
@@ -0,0 +1,33 @@
+from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.settings import api_settings
+from .search import get_search_backend
+
+
+class PostSearchFilter(SearchFilter):
+    """?search= served by the full-text engine in posts.search, ranked by relevance."""
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return get_search_backend().search(queryset, query)
+
+
+class StableOrderingFilter(OrderingFilter):
+    """OrderingFilter that always ends with (-created_at, -id).
+
+    likes_count and comments_count have many ties, so without a tie-breaker
+    rows can repeat or vanish between pages. The tie-breakers also match the
+    composite indexes on Post, so popularity sorts are served by an index.
+    """
+    tie_breakers = ['-created_at', '-id']
+
+    def get_ordering(self, request, queryset, view):
+        # Keep relevance order for searches unless the client asked for another one.
+        if request.query_params.get(api_settings.SEARCH_PARAM) and not request.query_params.get(self.ordering_param):
+            return None
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        fields = {field.lstrip('-') for field in ordering}
+        return list(ordering) + [field for field in self.tie_breakers if field.lstrip('-') not in fields]
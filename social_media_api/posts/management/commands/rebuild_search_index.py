@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from posts.models import Post
+from posts.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Create the post search index if needed and re-index every post'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.batch_size = options['batch_size']
+        started = time.monotonic()
+        indexed = backend.rebuild(Post.objects.all())
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {indexed} posts with {type(backend).__name__} in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from accounts.models import CustomUser
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = 'Regenerate materialized home timelines from the follow graph'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only rebuild the timeline of this user id')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.order_by('id')
+        if options['user']:
+            users = users.filter(id=options['user'])
+
+        rebuilt = 0
+        for user in users.iterator(chunk_size=options['batch_size']):
+            timeline.rebuild(user)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} timelines'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Max
+from posts.models import Post, Comment, Like, count_subquery
+
+
+class Command(BaseCommand):
+    help = 'Rebuild stored likes_count / comments_count counters on posts and comments in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        post_likes = Like.objects.filter(content_type=ContentType.objects.get_for_model(Post))
+        posts = self.reconcile(Post, batch_size, {
+            'likes_count': count_subquery(post_likes, 'object_id'),
+            'comments_count': count_subquery(Comment.objects.all(), 'post'),
+        })
+        self.stdout.write(self.style.SUCCESS(f'Reconciled counters for {posts} posts'))
+
+        comment_likes = Like.objects.filter(content_type=ContentType.objects.get_for_model(Comment))
+        comments = self.reconcile(Comment, batch_size, {
+            'likes_count': count_subquery(comment_likes, 'object_id'),
+        })
+        self.stdout.write(self.style.SUCCESS(f'Reconciled counters for {comments} comments'))
+
+    def reconcile(self, model, batch_size, counters):
+        # Walk the table in primary key ranges so each UPDATE stays short.
+        max_id = model.objects.aggregate(max_id=Max('pk'))['max_id'] or 0
+        updated = 0
+        start = 0
+        while start <= max_id:
+            updated += model.objects.filter(pk__gte=start, pk__lt=start + batch_size).update(**counters)
+            start += batch_size
+        return updated
@@ -1,7 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Prefetch, Q, Subquery, Window
+from django.db.models.functions import Coalesce, RowNumber
 from django.conf import settings
 from django.utils import timezone
-from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
 
 # Create your models here.
@@ -15,26 +17,21 @@ class Post(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    likes = GenericRelation('Like', related_query_name='post')
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='post_recent_idx'),
+            models.Index(fields=['-likes_count', '-created_at', '-id'], name='post_most_liked_idx'),
+            models.Index(fields=['-comments_count', '-created_at', '-id'], name='post_most_discussed_idx'),
+        ]
 
     def __str__(self):
         return f'{self.title} by {self.author.username}'
 
-
-    @property
-    def comments_count(self):
-        return self.comments.count()
-    
-    @property
-    def likes_count(self):
-        content_type = ContentType.objects.get_for_model(self)
-        return Like.objects.filter(
-            content_type=content_type,
-            object_id=self.id
-        ).count()
-
     def get_like(self, user):
         content_type = ContentType.objects.get_for_model(self)
         return Like.objects.filter(
@@ -57,17 +54,14 @@ class Comment(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    
-    @property
-    def likes_count(self):
-        content_type = ContentType.objects.get_for_model(self)
-        return Like.objects.filter(
-            content_type=content_type,
-            object_id=self.id
-        ).count()
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    likes = GenericRelation('Like', related_query_name='comment')
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='comment_post_oldest_idx'),
+        ]
 
     def __str__(self):
         return f'Commented by {self.author.username} on {self.post.title}'
@@ -81,6 +75,32 @@ class Comment(models.Model):
             object_id = self.id
         ).first()
 
+def latest_likes_prefetch(limit):
+    """Prefetch only the newest `limit` likes of each post or comment, with their users, into latest_likes."""
+    likes = Like.objects.annotate(
+        row_number=Window(
+            RowNumber(),
+            partition_by=[F('content_type_id'), F('object_id')],
+            order_by=[F('created_at').desc(), F('id').desc()]
+        )
+    ).filter(row_number__lte=limit).select_related('user').order_by('-created_at', '-id')
+    return Prefetch('likes', queryset=likes, to_attr='latest_likes')
+
+def latest_comments_prefetch(limit):
+    """Prefetch only the newest `limit` comments of each post into post.latest_comments.
+
+    ROW_NUMBER() partitioned by post keeps this to one query for the whole
+    page, however many comments each post has.
+    """
+    comments = Comment.objects.annotate(
+        row_number=Window(
+            RowNumber(),
+            partition_by=F('post_id'),
+            order_by=[F('created_at').desc(), F('id').desc()]
+        )
+    ).filter(row_number__lte=limit).select_related('author').order_by('-created_at', '-id')
+    return Prefetch('comments', queryset=comments, to_attr='latest_comments')
+
 class Like(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -95,7 +115,130 @@ class Like(models.Model):
     class Meta:
         unique_together = ['user', 'content_type', 'object_id']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['content_type', 'object_id', '-created_at'], name='like_target_recent_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.username} liked {self.content_object}'
 
+    @classmethod
+    def liked_object_ids(cls, user, model, object_ids):
+        """Return the subset of object_ids (instances of model) liked by user, in one query."""
+        return set(cls.objects.filter(
+            user = user,
+            content_type = ContentType.objects.get_for_model(model),
+            object_id__in = object_ids
+        ).values_list('object_id', flat=True))
+
+    @classmethod
+    def bulk_set(cls, user, targets):
+        """Set the like state of many targets for user at once.
+
+        targets maps a Post or Comment instance to the desired state (True to
+        like, False to unlike). Everything happens in one transaction: one
+        bulk INSERT, one DELETE and one counter recount per model. Returns
+        the targets that were newly liked.
+        """
+        content_types = ContentType.objects.get_for_models(*{type(target) for target in targets})
+        keys = {(content_types[type(target)].id, target.id): target for target in targets}
+
+        def matching(pairs):
+            object_ids = {}
+            for content_type_id, object_id in pairs:
+                object_ids.setdefault(content_type_id, []).append(object_id)
+            condition = Q(pk__in=[])
+            for content_type_id, ids in object_ids.items():
+                condition |= Q(content_type_id=content_type_id, object_id__in=ids)
+            return cls.objects.filter(condition, user=user)
+
+        with transaction.atomic():
+            existing = set(matching(keys).values_list('content_type_id', 'object_id'))
+            to_like = [key for key, target in keys.items() if targets[target] and key not in existing]
+            to_unlike = [key for key, target in keys.items() if not targets[target] and key in existing]
+
+            cls.objects.bulk_create([
+                cls(user=user, content_type_id=content_type_id, object_id=object_id)
+                for content_type_id, object_id in to_like
+            ], ignore_conflicts=True)
+            if to_unlike:
+                unliked = matching(to_unlike)
+                # Recounted below, so posts.signals.decrement_likes_count skips these.
+                unliked.recounts_likes = True
+                unliked.delete()
+
+            for model, content_type in content_types.items():
+                ids = [target.id for target in targets if type(target) is model]
+                model.objects.filter(id__in=ids).update(
+                    likes_count=count_subquery(cls.objects.filter(content_type=content_type), 'object_id')
+                )
+
+        return [keys[key] for key in to_like]
+
+    @classmethod
+    def toggle(cls, user, target):
+        """Like or unlike target for user, keeping target.likes_count in sync.
+
+        Returns True if the target is now liked. target.likes_count is
+        refreshed from the database afterwards.
+        """
+        content_type = ContentType.objects.get_for_model(target)
+        with transaction.atomic():
+            like, created = cls.objects.get_or_create(
+                user = user,
+                content_type = content_type,
+                object_id = target.id
+            )
+            if created:
+                adjust_counter(target, 'likes_count', 1)
+            else:
+                # posts.signals.decrement_likes_count adjusts the counter.
+                like.delete()
+        target.refresh_from_db(fields=['likes_count'])
+        return created
+
+
+def count_subquery(queryset, field):
+    """COUNT of queryset rows whose `field` points at the outer row, for use in update()."""
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(total=Count('*')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def adjust_counter(instance, field, delta):
+    """Atomically add delta to a stored counter column without reading it first."""
+    queryset = type(instance).objects.filter(pk=instance.pk)
+    if delta < 0:
+        # Never let a counter drift below zero if it was already out of sync.
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+class TimelineEntry(models.Model):
+    """A post pushed into a follower's home timeline when it was written (see posts.timeline)."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at']
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='timeline_user_recent_idx'),
+            models.Index(fields=['user', 'author']),
+        ]
+
+    def __str__(self):
+        return f'{self.post.title} in {self.user.username}\'s timeline'
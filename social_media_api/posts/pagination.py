@@ -1,5 +1,13 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection
+from django.db.models import DateTimeField, Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 class CustomPagination(PageNumberPagination):
     page_size = 10
@@ -17,4 +25,201 @@ class CustomPagination(PageNumberPagination):
             'total_pages': self.page.paginator.num_pages,
             'current_page': self.page.number,
             'results': data
-        })
\ No newline at end of file
+        })
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination keyed on the queryset's ordering, ending with id.
+
+    The ordering is the one already applied to the queryset (for example by
+    ?ordering=), or `ordering` when there is none. Each page is a range scan
+    that starts right after the last row of the previous page, so it costs
+    the same at any scroll depth. Orderings that are not plain model fields,
+    such as search relevance, cannot be resumed from a cursor and are
+    rejected. No COUNT runs unless the client asks for one with
+    ?include_total=true, and even then the total is estimated for large
+    tables.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    total_query_param = 'include_total'
+    ordering = '-created_at'
+    count_cap = 1000
+
+    invalid_cursor_message = 'Invalid cursor'
+    invalid_ordering_message = 'This ordering cannot be combined with cursor pagination.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.keys = self.get_keys(queryset)
+
+        cursor = self.decode_cursor(request)
+        self.has_cursor = cursor is not None
+        self.reverse = bool(cursor and cursor['r'])
+
+        page = queryset
+        if cursor:
+            page = page.filter(self.after(cursor))
+        page = list(page.order_by(*self.order_by())[:self.page_size + 1])
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if self.reverse:
+            page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.has_cursor
+
+        self.total = None
+        if request.query_params.get(self.total_query_param, '').lower() == 'true':
+            self.total = estimate_count(queryset, self.count_cap)
+
+        self.page = page
+        return page
+
+    def get_keys(self, queryset):
+        """[(field name, descending, is datetime)] for the active ordering, ending with id."""
+        ordering = list(queryset.query.order_by) or [self.ordering]
+        keys = []
+        for term in ordering:
+            if not isinstance(term, str) or term.lstrip('-') in ('?', 'pk'):
+                raise ParseError(self.invalid_ordering_message)
+            name = term.lstrip('-')
+            try:
+                field = queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise ParseError(self.invalid_ordering_message)
+            if name not in {key[0] for key in keys}:
+                keys.append((name, term.startswith('-'), isinstance(field, DateTimeField)))
+            if name == 'id':
+                break
+        if keys[-1][0] != 'id':
+            keys.append(('id', keys[-1][1], False))
+        return keys
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def order_by(self):
+        # Walking backwards flips every direction; results are reversed again afterwards.
+        return [f'{"-" if descending != self.reverse else ""}{name}' for name, descending, _ in self.keys]
+
+    def after(self, cursor):
+        """Rows strictly after the cursor in (key1, key2, ..., id) order."""
+        values = []
+        for (name, _, is_datetime), value in zip(self.keys, cursor['v']):
+            values.append(parse_datetime(value) if is_datetime and value is not None else value)
+        condition = Q(pk__in=[])
+        for index, (name, descending, _) in enumerate(self.keys):
+            lookup = 'lt' if descending != self.reverse else 'gt'
+            equal = {key[0]: value for key, value in zip(self.keys[:index], values)}
+            condition |= Q(**equal, **{f'{name}__{lookup}': values[index]})
+        return condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+        except (ValueError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if (
+            not isinstance(cursor, dict) or not {'v', 'o', 'r'} <= cursor.keys()
+            or cursor['o'] != self.signature() or not isinstance(cursor['v'], list)
+            or len(cursor['v']) != len(self.keys) or not isinstance(cursor['v'][-1], int)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def signature(self):
+        return ','.join(f'{"-" if descending else ""}{name}' for name, descending, _ in self.keys)
+
+    def encode_cursor(self, obj, reverse):
+        values = []
+        for name, _, is_datetime in self.keys:
+            value = getattr(obj, name)
+            values.append(value.isoformat() if is_datetime and value is not None else value)
+        payload = json.dumps({'v': values, 'o': self.signature(), 'r': reverse}, separators=(',', ':'))
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, base64.urlsafe_b64encode(payload.encode()).decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        response = {
+            'links': {
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link()
+            },
+            'page_size': self.page_size,
+            'results': data
+        }
+        if self.total is not None:
+            response['count'], response['count_is_estimate'] = self.total
+        return Response(response)
+
+def estimate_count(queryset, cap):
+    """Return (count, is_estimate) without scanning more than cap rows.
+
+    On PostgreSQL the planner's row estimate is used once the real count
+    would exceed cap; elsewhere the count is simply capped.
+    """
+    exact = queryset.order_by()[:cap + 1].count()
+    if exact <= cap:
+        return exact, False
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return max(int(plan[0]['Plan']['Plan Rows']), cap), True
+    return cap, True
+
+def wants_cursor(request):
+    return 'cursor' in request.query_params or request.query_params.get('pagination') == 'cursor'
+
+def select_paginator(request, page_class, cursor_class):
+    """Pick keyset pagination when the client asks for it (?pagination=cursor or a cursor param)."""
+    if cursor_class is not None and wants_cursor(request):
+        return cursor_class()
+    return page_class()
+
+class CursorSelectableMixin:
+    """Lets a view serve either page-number or keyset pages, chosen per request."""
+    cursor_pagination_class = None
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = select_paginator(self.request, self.pagination_class, self.cursor_pagination_class)
+        return self._paginator
+
+class PostCursorPagination(KeysetPagination):
+    ordering = '-created_at'
+
+class CommentCursorPagination(KeysetPagination):
+    ordering = 'created_at'
+
+class LikeCursorPagination(KeysetPagination):
+    ordering = '-created_at'
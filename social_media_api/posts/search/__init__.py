@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'sqlite': 'posts.search.sqlite.SQLiteFTSBackend',
+    'postgresql': 'posts.search.postgres.PostgresSearchBackend',
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """Return the configured post search backend.
+
+    POST_SEARCH_BACKEND can name a backend class explicitly; otherwise one is
+    picked for the database vendor, falling back to plain LIKE matching.
+    """
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'POST_SEARCH_BACKEND', None) or BACKENDS.get(
+            connection.vendor, 'posts.search.base.DatabaseSearchBackend'
+        )
+        _backend = import_string(path)()
+    return _backend
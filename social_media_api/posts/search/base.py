@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.db.models import Case, IntegerField, Max, Q, When
+
+
+class BaseSearchBackend:
+    """Interface shared by the post search engines.
+
+    Backends keep their own index next to posts_post, created after migrate,
+    updated one post at a time from signals and rebuilt in bulk by the
+    rebuild_search_index command.
+    """
+    batch_size = 500
+
+    def __init__(self):
+        self.max_results = getattr(settings, 'POST_SEARCH_MAX_RESULTS', 500)
+
+    def create_index(self):
+        """Create the index if it does not exist yet."""
+        pass
+
+    def index_post(self, post):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def search_ids(self, query, limit):
+        """Return ids of matching posts, best match first."""
+        raise NotImplementedError
+
+    def search(self, queryset, query):
+        """Filter queryset down to posts matching query, ordered by relevance."""
+        ids = self.search_ids(query, self.max_results)
+        if not ids:
+            return queryset.none()
+        rank = Case(*[When(id=post_id, then=position) for position, post_id in enumerate(ids)], output_field=IntegerField())
+        return queryset.filter(id__in=ids).order_by(rank)
+
+    def index_range(self, start, end):
+        """Index every post with start <= id < end in one statement."""
+        raise NotImplementedError
+
+    def rebuild(self, posts):
+        self.create_index()
+        self.clear()
+        max_id = posts.aggregate(max_id=Max('id'))['max_id'] or 0
+        for start in range(0, max_id + 1, self.batch_size):
+            self.index_range(start, start + self.batch_size)
+        return posts.count()
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Unindexed LIKE matching, used on databases without a dedicated engine."""
+
+    def search(self, queryset, query):
+        for term in query.split():
+            queryset = queryset.filter(
+                Q(title__icontains=term) | Q(content__icontains=term) | Q(author__username__icontains=term)
+            )
+        return queryset
+
+    def rebuild(self, posts):
+        return 0
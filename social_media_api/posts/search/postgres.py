@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.db import connection
+from accounts.models import CustomUser
+from posts.models import Post
+from .base import BaseSearchBackend
+
+DOCUMENT = (
+    "setweight(to_tsvector(%s::regconfig, {title}), 'A') || "
+    "setweight(to_tsvector(%s::regconfig, {author}), 'B') || "
+    "setweight(to_tsvector(%s::regconfig, {content}), 'C')"
+)
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector documents in a side table with a GIN index, used in production."""
+    table = 'posts_post_search'
+
+    def __init__(self):
+        super().__init__()
+        self.config = getattr(settings, 'POST_SEARCH_CONFIG', 'english')
+
+    def create_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                f'post_id bigint PRIMARY KEY REFERENCES posts_post(id) ON DELETE CASCADE, '
+                f'document tsvector NOT NULL)'
+            )
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_document_idx ON {self.table} USING GIN (document)')
+
+    def index_post(self, post):
+        with connection.cursor() as cursor:
+            document = DOCUMENT.format(title='%s', author='%s', content='%s')
+            cursor.execute(
+                f'INSERT INTO {self.table} (post_id, document) VALUES (%s, {document}) '
+                f'ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document',
+                [post.id, self.config, post.title, self.config, post.author.username, self.config, post.content]
+            )
+
+    def index_range(self, start, end):
+        with connection.cursor() as cursor:
+            document = DOCUMENT.format(title='p.title', author='u.username', content='p.content')
+            cursor.execute(
+                f'INSERT INTO {self.table} (post_id, document) SELECT p.id, {document} '
+                f'FROM {Post._meta.db_table} p JOIN {CustomUser._meta.db_table} u ON u.id = p.author_id '
+                f'WHERE p.id >= %s AND p.id < %s '
+                f'ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document',
+                [self.config, self.config, self.config, start, end]
+            )
+
+    def remove_post(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE post_id = %s', [post_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {self.table}')
+
+    def search_ids(self, query, limit):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT post_id FROM {self.table}, websearch_to_tsquery(%s::regconfig, %s) query '
+                f'WHERE document @@ query ORDER BY ts_rank(document, query) DESC, post_id DESC LIMIT %s',
+                [self.config, query, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,53 @@
+from django.db import connection
+from accounts.models import CustomUser
+from posts.models import Post
+from .base import BaseSearchBackend
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """SQLite FTS5 index, used in development and tests."""
+    table = 'posts_post_fts'
+
+    def create_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+                f"USING fts5(title, content, author, tokenize='porter unicode61')"
+            )
+
+    def index_post(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT OR REPLACE INTO {self.table}(rowid, title, content, author) VALUES (%s, %s, %s, %s)',
+                [post.id, post.title, post.content, post.author.username]
+            )
+
+    def remove_post(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [post_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def index_range(self, start, end):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT OR REPLACE INTO {self.table}(rowid, title, content, author) '
+                f'SELECT p.id, p.title, p.content, u.username FROM {Post._meta.db_table} p '
+                f'JOIN {CustomUser._meta.db_table} u ON u.id = p.author_id WHERE p.id >= %s AND p.id < %s',
+                [start, end]
+            )
+
+    def search_ids(self, query, limit):
+        # Quote every term so user input is never parsed as FTS5 query syntax.
+        terms = ['"{}"'.format(term.replace('"', '""')) for term in query.split()]
+        if not terms:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s '
+                f'ORDER BY bm25({self.table}, 10.0, 1.0, 5.0) LIMIT %s',
+                [' '.join(terms), limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
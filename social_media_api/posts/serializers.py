@@ -1,8 +1,76 @@
+from django.db import models
 from rest_framework import serializers
 from .models import Post, Comment, Like
 from accounts.serializers import UserProfileSerializer
+from accounts.images import avatar_urls
 from django.contrib.contenttypes.models import ContentType
 
+DEFAULT_COMMENTS_LIMIT = 5
+MAX_COMMENTS_LIMIT = 20
+# Newest likes embedded with ?expand=likes; the rest are paged at /api/posts/<id>/likes/.
+EXPANDED_LIKES_LIMIT = 10
+
+def get_comments_limit(request):
+    """Number of latest comments embedded per post, from ?comments_limit=."""
+    try:
+        limit = int(request.query_params.get('comments_limit', DEFAULT_COMMENTS_LIMIT))
+    except (AttributeError, ValueError):
+        return DEFAULT_COMMENTS_LIMIT
+    return min(max(limit, 0), MAX_COMMENTS_LIMIT)
+
+def split_param(request, name):
+    if request is None:
+        return set()
+    return {value.strip() for value in request.query_params.get(name, '').split(',') if value.strip()}
+
+def get_expanded_fields(request, default=()):
+    """Expandable fields requested with ?expand=likes,comments (plus any view default)."""
+    return split_param(request, 'expand') | set(default)
+
+class DynamicFieldsMixin:
+    """Sparse fieldsets (?fields=id,title) and opt-in expansion (?expand=likes).
+
+    Fields listed in Meta.expandable_fields are left out unless expanded,
+    either by the client or by the view through context['expand'].
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        expanded = get_expanded_fields(request, self.context.get('expand', ()))
+        for name in getattr(self.Meta, 'expandable_fields', ()):
+            if name not in expanded:
+                fields.pop(name, None)
+        requested = split_param(request, 'fields')
+        if requested:
+            for name in list(fields):
+                if name not in requested:
+                    fields.pop(name)
+        return fields
+
+class LikedListSerializer(serializers.ListSerializer):
+    """Resolves is_liked for the whole page with one Like query instead of one per object."""
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.Manager) else data)
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            self.child.liked_ids = Like.liked_object_ids(
+                request.user, self.child.Meta.model, [item.id for item in items]
+            )
+        return super().to_representation(items)
+
+class LikedMixin:
+    liked_ids = None
+
+    def get_is_liked(self, obj):
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            if self.liked_ids is not None:
+                return obj.id in self.liked_ids
+            return obj.get_like(request.user) is not None
+        return False
+
 class LikeSerializer(serializers.ModelSerializer):
     user = UserProfileSerializer(read_only=True)
     
@@ -11,7 +79,7 @@ class LikeSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'created_at']
         read_only_fields = ['id', 'user', 'created_at']
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(LikedMixin, serializers.ModelSerializer):
     author = UserProfileSerializer(read_only=True)
     likes_count = serializers.ReadOnlyField()
     is_liked = serializers.SerializerMethodField()
@@ -23,24 +91,19 @@ class CommentSerializer(serializers.ModelSerializer):
             'likes_count', 'is_liked'
         ]
         read_only_fields = ['id', 'author', 'created_at', 'updated_at', 'post']
-
-    def get_is_liked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.get_like(request.user) is not None
-        return False
+        list_serializer_class = LikedListSerializer
 
     def create(self, validated_data):
         validated_data['author'] = self.context['request'].user
         return super().create(validated_data)
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(DynamicFieldsMixin, LikedMixin, serializers.ModelSerializer):
     author = UserProfileSerializer(read_only=True)
     comments_count = serializers.ReadOnlyField()
     likes_count = serializers.ReadOnlyField()
     is_liked = serializers.SerializerMethodField()
     comments = serializers.SerializerMethodField()
-    likes = LikeSerializer(many=True, read_only=True)
+    likes = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
@@ -49,16 +112,23 @@ class PostSerializer(serializers.ModelSerializer):
             'likes_count', 'comments_count', 'is_liked', 'comments', 'likes'
         ]
         read_only_fields = ['id', 'author', 'created_at', 'updated_at']
+        expandable_fields = ['comments', 'likes']
+        list_serializer_class = LikedListSerializer
 
-    def get_is_liked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.get_like(request.user) is not None
-        return False
+    def get_likes(self, obj):
+        if hasattr(obj, 'latest_likes'):
+            likes = obj.latest_likes
+        else:
+            likes = obj.likes.select_related('user').order_by('-created_at', '-id')[:EXPANDED_LIKES_LIMIT]
+        return LikeSerializer(likes, many=True, context=self.context).data
 
     def get_comments(self, obj):
         """Get comments without circular imports"""
-        comments = obj.comments.all()[:5]
+        if hasattr(obj, 'latest_comments'):
+            comments = obj.latest_comments
+        else:
+            limit = get_comments_limit(self.context.get('request'))
+            comments = obj.comments.select_related('author').order_by('-created_at', '-id')[:limit]
         # Return basic comment data without using CommentSerializer
         comment_data = []
         for comment in comments:
@@ -69,7 +139,8 @@ class PostSerializer(serializers.ModelSerializer):
                     'username': comment.author.username,
                     'first_name': comment.author.first_name,
                     'last_name': comment.author.last_name,
-                    'profile_picture': comment.author.profile_picture.url if comment.author.profile_picture else None
+                    'profile_picture': comment.author.profile_picture.url if comment.author.profile_picture else None,
+                    'avatar': avatar_urls(comment.author, 48)
                 },
                 'content': comment.content,
                 'created_at': comment.created_at,
@@ -92,3 +163,12 @@ class CommentCreateSerializer(serializers.ModelSerializer):
         model = Comment
         fields = ['content', 'post']
 
+
+
+class BulkLikeItemSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=['post', 'comment'])
+    id = serializers.IntegerField()
+    liked = serializers.BooleanField()
+
+class BulkLikeSerializer(serializers.Serializer):
+    items = BulkLikeItemSerializer(many=True, allow_empty=False, max_length=100)
@@ -0,0 +1,128 @@
+import logging
+from django.contrib.contenttypes.models import ContentType
+from django.db import DatabaseError, transaction
+from django.db.models import F, QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete, post_migrate, m2m_changed
+from django.dispatch import receiver
+from accounts.models import CustomUser, Follow
+from .models import Post, Comment, Like, TimelineEntry, adjust_counter
+from . import timeline
+from .cache import bump_versions
+from .search import get_search_backend
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Comment)
+def increment_comments_count(sender, instance, created, **kwargs):
+    if created:
+        adjust_counter(Post(pk=instance.post_id), 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comments_count(sender, instance, **kwargs):
+    adjust_counter(Post(pk=instance.post_id), 'comments_count', -1)
+
+
+@receiver(post_delete, sender=Like)
+def decrement_likes_count(sender, instance, origin=None, **kwargs):
+    # Only for deletes of the likes themselves (toggle, the admin); bulk_set
+    # recounts its targets itself.
+    # Cascades from a deleted user are counted by release_likes; cascades from
+    # a deleted post or comment leave no counter to fix.
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is not Like or getattr(origin, 'recounts_likes', False):
+        return
+    model = ContentType.objects.get_for_id(instance.content_type_id).model_class()
+    adjust_counter(model(pk=instance.object_id), 'likes_count', -1)
+
+
+@receiver(pre_delete, sender=CustomUser)
+def release_likes(sender, instance, **kwargs):
+    # The user's likes go by cascade; take one off each target they liked.
+    likes = Like.objects.filter(user=instance)
+    for content_type_id in likes.values_list('content_type_id', flat=True).distinct().order_by():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        model.objects.filter(
+            id__in = likes.filter(content_type_id=content_type_id).values('object_id'),
+            likes_count__gte = 1
+        ).update(likes_count=F('likes_count') - 1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: timeline.fan_out_post(instance))
+
+
+@receiver(post_migrate)
+def create_search_index(sender, **kwargs):
+    if sender.name == 'posts':
+        get_search_backend().create_index()
+
+
+def update_search_index(update, *args):
+    # The post is already committed; a stale search entry is fixed by the next
+    # save or by rebuild_search_index, so don't fail the request over it.
+    try:
+        update(*args)
+    except DatabaseError:
+        logger.exception('Could not update the post search index')
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    transaction.on_commit(lambda: update_search_index(get_search_backend().index_post, instance))
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    post_id = instance.id
+    transaction.on_commit(lambda: update_search_index(get_search_backend().remove_post, post_id))
+
+
+@receiver(m2m_changed, sender=Follow)
+def sync_timelines_on_follow(sender, instance, action, reverse, pk_set, **kwargs):
+    # reverse=True means the change came through user.following (instance is the follower).
+    if action == 'pre_clear':
+        if reverse:
+            TimelineEntry.objects.filter(user=instance).delete()
+        else:
+            TimelineEntry.objects.filter(author=instance).delete()
+        return
+    if action not in ('post_add', 'post_remove'):
+        return
+
+    if reverse:
+        pairs = [(instance.id, author_id) for author_id in pk_set]
+    else:
+        pairs = [(follower_id, instance.id) for follower_id in pk_set]
+
+    for follower_id, author_id in pairs:
+        if action == 'post_add':
+            author = instance if author_id == instance.id else CustomUser.objects.get(id=author_id)
+            timeline.backfill(follower_id, author)
+        else:
+            timeline.evict(follower_id, author_id)
+
+
+def invalidate_on_commit(post_ids):
+    transaction.on_commit(lambda: bump_versions(post_ids))
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    invalidate_on_commit([instance.id])
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_comment(sender, instance, **kwargs):
+    invalidate_on_commit([instance.post_id])
+
+
+@receiver([post_save, post_delete], sender=Like)
+def invalidate_like(sender, instance, **kwargs):
+    if instance.content_type_id == ContentType.objects.get_for_model(Post).id:
+        invalidate_on_commit([instance.object_id])
+    elif instance.content_type_id == ContentType.objects.get_for_model(Comment).id:
+        invalidate_on_commit(Comment.objects.filter(id=instance.object_id).values_list('post_id', flat=True))
@@ -1,3 +1,364 @@
-from django.test import TestCase
+from unittest import mock
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from accounts.models import CustomUser
+from notifications.models import NotificationOutbox
+from .models import Post, Comment, Like, TimelineEntry
+from .search import get_search_backend
+from . import timeline
 
-# Create your tests here.
+
+def make_user(username):
+    return CustomUser.objects.create_user(username=username, email=f'{username}@example.com', password='password')
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.author = make_user('author')
+        self.reader = make_user('reader')
+        self.post = Post.objects.create(author=self.author, title='Title', content='Content')
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def test_like_toggle_keeps_likes_count(self):
+        response = self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(response.data, {'liked': True, 'likes_count': 1})
+        response = self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(response.data, {'liked': False, 'likes_count': 0})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_comment_like_toggle(self):
+        comment = Comment.objects.create(post=self.post, author=self.author, content='Hi')
+        self.assertTrue(Like.toggle(self.reader, comment))
+        self.assertEqual(comment.likes_count, 1)
+        self.assertFalse(Like.toggle(self.reader, comment))
+        self.assertEqual(comment.likes_count, 0)
+
+    def test_comments_count_follows_creates_and_deletes(self):
+        comments = [Comment.objects.create(post=self.post, author=self.reader, content=str(i)) for i in range(3)]
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 3)
+        comments[0].delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 2)
+
+    def test_deleting_a_liker_releases_their_likes(self):
+        comment = Comment.objects.create(post=self.post, author=self.author, content='Hi')
+        other = Post.objects.create(author=self.reader, title='Own post', content='Content')
+        for target in (self.post, comment, other):
+            Like.toggle(self.reader, target)
+        Like.toggle(self.author, self.post)
+        self.reader.delete()
+        self.post.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual((self.post.likes_count, comment.likes_count), (1, 0))
+
+    def test_deleting_likes_directly_updates_counters(self):
+        comment = Comment.objects.create(post=self.post, author=self.author, content='Hi')
+        Like.toggle(self.reader, self.post)
+        Like.toggle(self.author, self.post)
+        Like.toggle(self.reader, comment)
+        Like.objects.filter(user=self.reader).delete()
+        Like.objects.get(user=self.author).delete()
+        self.post.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual((self.post.likes_count, comment.likes_count), (0, 0))
+
+    def test_counter_never_goes_negative(self):
+        Like.objects.create(user=self.reader, content_object=self.post)
+        Like.toggle(self.reader, self.post)
+        self.assertEqual(self.post.likes_count, 0)
+
+
+class LikedFlagTests(TestCase):
+    def setUp(self):
+        self.author = make_user('author')
+        self.reader = make_user('reader')
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def like_new_content(self, count):
+        for i in range(count):
+            post = Post.objects.create(author=self.author, title=str(i), content='Content')
+            Like.toggle(self.reader, post)
+            Like.toggle(self.reader, Comment.objects.create(post=post, author=self.author, content='Hi'))
+
+    def my_likes_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/likes/my-likes/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_my_likes_runs_constant_queries(self):
+        self.like_new_content(2)
+        few, response = self.my_likes_queries()
+        self.assertTrue(all(comment['is_liked'] for comment in response.data['liked_comments']))
+        self.like_new_content(4)
+        many, response = self.my_likes_queries()
+        self.assertEqual(len(response.data['liked_comments']), 6)
+        self.assertEqual(few, many)
+
+    def test_post_list_resolves_is_liked(self):
+        self.like_new_content(3)
+        Post.objects.create(author=self.author, title='unliked', content='Content')
+        response = self.client.get('/api/posts/')
+        flags = {post['title']: post['is_liked'] for post in response.data['results']}
+        self.assertEqual(flags, {'0': True, '1': True, '2': True, 'unliked': False})
+
+
+class BulkLikeTests(TestCase):
+    def setUp(self):
+        self.author = make_user('author')
+        self.reader = make_user('reader')
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def make_targets(self, count):
+        """count posts and comments, the first half of each already liked by reader."""
+        posts = [Post.objects.create(author=self.author, title=str(i), content='Content') for i in range(count)]
+        comments = [Comment.objects.create(post=post, author=self.author, content='Hi') for post in posts]
+        for target in posts[:count // 2] + comments[:count // 2]:
+            Like.toggle(self.reader, target)
+        return posts, comments
+
+    def flip(self, posts, comments):
+        """Unlike the liked half and like the rest, in one request."""
+        half = len(posts) // 2
+        items = [
+            {'type': type_name, 'id': target.id, 'liked': index >= half}
+            for type_name, targets in (('post', posts), ('comment', comments))
+            for index, target in enumerate(targets)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/likes/bulk/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_mixed_likes_and_unlikes_keep_counters(self):
+        posts, comments = self.make_targets(4)
+        other = make_user('other')
+        Like.toggle(other, posts[0])
+        Like.toggle(other, comments[3])
+        response, _ = self.flip(posts, comments)
+
+        self.assertEqual([post.likes_count for post in Post.objects.order_by('id')], [1, 0, 1, 1])
+        self.assertEqual([comment.likes_count for comment in Comment.objects.order_by('id')], [0, 0, 1, 2])
+        self.assertEqual(
+            set(Like.objects.filter(user=self.reader).values_list('object_id', flat=True)),
+            {posts[2].id, posts[3].id, comments[2].id, comments[3].id}
+        )
+        self.assertEqual(
+            {(item['type'], item['id']): item['likes_count'] for item in response.data['results']},
+            {**{('post', post.id): count for post, count in zip(posts, [1, 0, 1, 1])},
+             **{('comment', comment.id): count for comment, count in zip(comments, [0, 0, 1, 2])}}
+        )
+
+    def test_newly_liked_targets_are_notified_in_one_batch(self):
+        posts, comments = self.make_targets(4)
+        with mock.patch.object(NotificationOutbox, 'enqueue_many', wraps=NotificationOutbox.enqueue_many) as enqueue_many:
+            self.flip(posts, comments)
+        enqueue_many.assert_called_once()
+        events = NotificationOutbox.objects.filter(actor=self.reader)
+        self.assertCountEqual(
+            [(event.verb, event.target_object_id) for event in events],
+            [('like_post', posts[2].id), ('like_post', posts[3].id), ('like_comment', comments[2].id), ('like_comment', comments[3].id)]
+        )
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        _, few = self.flip(*self.make_targets(2))
+        _, many = self.flip(*self.make_targets(10))
+        self.assertEqual(few, many)
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.author = make_user('author')
+
+    def publish(self, title, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(author=self.author, title=title, content=content)
+
+    def test_new_posts_are_searchable(self):
+        cache.clear()
+        match = self.publish('Gardening tips', 'Tomatoes need sun')
+        self.publish('Cooking', 'Pasta recipes')
+        response = APIClient().get('/api/posts/?search=tomatoes')
+        self.assertEqual([post['id'] for post in response.data['results']], [match.id])
+
+    def test_index_failure_does_not_fail_the_save(self):
+        backend = get_search_backend()
+        with mock.patch.object(backend, 'index_post', side_effect=DatabaseError('index is gone')):
+            with self.assertLogs('posts.signals', 'ERROR'):
+                post = self.publish('Title', 'Content')
+        self.assertTrue(Post.objects.filter(id=post.id).exists())
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.reader = make_user('reader')
+        self.authors = [make_user(f'author{i}') for i in range(2)]
+        for author in self.authors:
+            self.reader.follow(author)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def publish(self, author, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(author=author, title=title, content='Content')
+
+    def test_feed_pages_over_timeline_entries(self):
+        posts = [self.publish(self.authors[i % 2], str(i)) for i in range(5)]
+        self.publish(make_user('stranger'), 'not followed')
+        response = self.client.get('/api/feed/?pagination=cursor&page_size=3')
+        self.assertEqual([post['id'] for post in response.data['results']], [post.id for post in posts[:1:-1]])
+        response = self.client.get(response.data['links']['next'])
+        self.assertEqual([post['id'] for post in response.data['results']], [posts[1].id, posts[0].id])
+
+    def test_feed_query_walks_the_index_in_order(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('query plan checked on SQLite')
+        plan = timeline.home_timeline(self.reader)[:10].explain()
+        self.assertIn('timeline_user_recent_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    @override_settings(TIMELINE_MAX_ENTRIES=3, TIMELINE_TRIM_INTERVAL=1)
+    def test_fan_out_trims_to_newest_entries(self):
+        posts = [self.publish(self.authors[0], str(i)) for i in range(5)]
+        entries = TimelineEntry.objects.filter(user=self.reader).order_by('-created_at', '-id')
+        self.assertEqual([entry.post_id for entry in entries], [post.id for post in posts[:1:-1]])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.author = make_user('author')
+        self.readers = [make_user(f'reader{i}') for i in range(3)]
+        self.posts = [Post.objects.create(author=self.author, title=str(i), content='Content') for i in range(5)]
+        for post, likes in zip(self.posts, [1, 3, 0, 3, 2]):
+            for reader in self.readers[:likes]:
+                Like.toggle(reader, post)
+        # Anonymous responses are cached (posts.cache) and the cache outlives each test.
+        cache.clear()
+        self.client = APIClient()
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['links']['next']
+        return ids
+
+    def test_cursor_pages_follow_newest_first(self):
+        ids = self.walk('/api/posts/?pagination=cursor&page_size=2')
+        self.assertEqual(ids, [post.id for post in reversed(self.posts)])
+
+    def test_cursor_pages_follow_requested_ordering(self):
+        ids = self.walk('/api/posts/?pagination=cursor&page_size=2&ordering=-likes_count')
+        expected = sorted(self.posts, key=lambda post: (-post.likes.count(), -post.created_at.timestamp(), -post.id))
+        self.assertEqual(ids, [post.id for post in expected])
+
+    def test_previous_link_returns_the_same_page(self):
+        first = self.client.get('/api/posts/?pagination=cursor&page_size=2&ordering=likes_count')
+        second = self.client.get(first.data['links']['next'])
+        back = self.client.get(second.data['links']['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+
+    def test_search_relevance_cannot_be_paged_by_cursor(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(author=self.author, title='Searchable', content='Content')
+        response = self.client.get('/api/posts/?pagination=cursor&search=content')
+        self.assertEqual(response.status_code, 400)
+
+    def test_comment_pages_use_the_post_index(self):
+        for i in range(5):
+            Comment.objects.create(post=self.posts[0], author=self.author, content=str(i))
+        ids = self.walk(f'/api/posts/{self.posts[0].id}/comments/?pagination=cursor&page_size=2')
+        self.assertEqual(ids, list(self.posts[0].comments.order_by('created_at', 'id').values_list('id', flat=True)))
+        if connection.vendor == 'sqlite':
+            plan = Comment.objects.filter(post=self.posts[0]).order_by('created_at', 'id')[:3].explain()
+            self.assertIn('comment_post_oldest_idx', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+            plan = Post.objects.order_by('-created_at', '-id')[:3].explain()
+            self.assertIn('post_recent_idx', plan)
+
+
+class AnonymousCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = make_user('author')
+        self.reader = make_user('reader')
+        self.post = Post.objects.create(author=self.author, title='Title', content='Content')
+        self.client = APIClient()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_repeat_requests_are_served_from_cache(self):
+        self.assertEqual(self.get('/api/posts/')['X-Cache'], 'MISS')
+        self.assertEqual(self.get('/api/posts/')['X-Cache'], 'HIT')
+        self.assertEqual(self.get(f'/api/posts/{self.post.id}/')['X-Cache'], 'MISS')
+        self.assertEqual(self.get(f'/api/posts/{self.post.id}/')['X-Cache'], 'HIT')
+
+    def test_writes_invalidate_cached_responses(self):
+        self.get('/api/posts/')
+        self.get(f'/api/posts/{self.post.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.toggle(self.reader, self.post)
+        response = self.get('/api/posts/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['likes_count'], 1)
+        response = self.get(f'/api/posts/{self.post.id}/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['likes_count'], 1)
+
+    def test_new_post_invalidates_the_list(self):
+        self.get('/api/posts/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(author=self.author, title='Second', content='Content')
+        response = self.get('/api/posts/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_authenticated_requests_bypass_the_cache(self):
+        self.get('/api/posts/')
+        self.client.force_authenticate(self.reader)
+        self.assertNotIn('X-Cache', self.get('/api/posts/'))
+
+
+class ExpandedLikesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = make_user('author')
+        self.post = Post.objects.create(author=self.author, title='Title', content='Content')
+        self.likers = [make_user(f'liker{i}') for i in range(12)]
+        for user in self.likers:
+            Like.toggle(user, self.post)
+        self.client = APIClient()
+
+    def test_detail_leaves_likes_out_by_default(self):
+        response = self.client.get(f'/api/posts/{self.post.id}/')
+        self.assertNotIn('likes', response.data)
+        self.assertEqual(response.data['likes_count'], 12)
+        self.assertIn('comments', response.data)
+
+    def test_expanded_likes_are_capped_to_the_newest(self):
+        response = self.client.get(f'/api/posts/{self.post.id}/?expand=likes')
+        usernames = [like['user']['username'] for like in response.data['likes']]
+        self.assertEqual(usernames, [f'liker{i}' for i in range(11, 1, -1)])
+        response = self.client.get('/api/posts/?expand=likes')
+        self.assertEqual(len(response.data['results'][0]['likes']), 10)
+
+    def test_likes_endpoint_pages_through_every_like(self):
+        ids, url = [], f'/api/posts/{self.post.id}/likes/?pagination=cursor&page_size=5'
+        while url:
+            response = self.client.get(url)
+            ids += [like['user']['id'] for like in response.data['results']]
+            url = response.data['links']['next']
+        self.assertEqual(ids, [user.id for user in reversed(self.likers)])
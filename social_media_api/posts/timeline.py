@@ -0,0 +1,118 @@
+import random
+from django.conf import settings
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from .models import Post, TimelineEntry
+
+# Home timelines are materialized on write: a new post is pushed into a
+# TimelineEntry row for every follower of its author, so reading a feed is a
+# range scan over (user, created_at). Authors with more followers than
+# TIMELINE_FANOUT_THRESHOLD are not fanned out; their posts are merged in at
+# read time instead.
+#
+# Each timeline keeps only its newest TIMELINE_MAX_ENTRIES entries. Trimming
+# a follower costs a window query, so fan-out trims a random
+# 1/TIMELINE_TRIM_INTERVAL of the followers it writes to, and a timeline can
+# briefly run over the limit by about that many entries.
+
+BATCH_SIZE = 1000
+
+
+def fanout_threshold():
+    return getattr(settings, 'TIMELINE_FANOUT_THRESHOLD', 10000)
+
+
+def backfill_limit():
+    return getattr(settings, 'TIMELINE_BACKFILL_LIMIT', 200)
+
+
+def max_entries():
+    return getattr(settings, 'TIMELINE_MAX_ENTRIES', 800)
+
+
+def trim_interval():
+    return getattr(settings, 'TIMELINE_TRIM_INTERVAL', 20)
+
+
+def is_fanned_out(author):
+    return author.followers_count <= fanout_threshold()
+
+
+def followed_unfanned_author_ids(user):
+    return list(user.following.filter(followers_count__gt=fanout_threshold()).values_list('id', flat=True))
+
+
+def home_timeline(user):
+    """user's home feed, newest first.
+
+    Usually these are user's TimelineEntry rows, so a page is a range scan on
+    timeline_user_recent_idx; load the page's posts with entry_posts(). When
+    user follows authors that are not fanned out, their posts have no
+    entries and the feed is a query over Post instead.
+    """
+    unfanned_ids = followed_unfanned_author_ids(user)
+    if not unfanned_ids:
+        return TimelineEntry.objects.filter(user=user).order_by('-created_at', '-id')
+    posts = Post.objects.filter(
+        Q(id__in=TimelineEntry.objects.filter(user=user).values('post_id')) |
+        Q(author_id__in=unfanned_ids)
+    )
+    return posts.order_by('-created_at', '-id')
+
+
+def entry_posts(entries, posts):
+    """The posts of a page of timeline entries, in page order, loaded from posts."""
+    by_id = posts.in_bulk([entry.post_id for entry in entries])
+    return [by_id[entry.post_id] for entry in entries if entry.post_id in by_id]
+
+
+def _entries(user_ids, posts):
+    return [
+        TimelineEntry(user_id=user_id, post_id=post.id, author_id=post.author_id, created_at=post.created_at)
+        for user_id in user_ids
+        for post in posts
+    ]
+
+
+def trim(user_ids):
+    """Delete all but the newest max_entries() entries of each user's timeline."""
+    if not user_ids:
+        return
+    excess = TimelineEntry.objects.filter(user_id__in=user_ids).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=F('user_id'),
+            order_by=[F('created_at').desc(), F('id').desc()]
+        )
+    ).filter(position__gt=max_entries()).values_list('id', flat=True)
+    TimelineEntry.objects.filter(id__in=list(excess)).delete()
+
+
+def fan_out_post(post):
+    if not is_fanned_out(post.author):
+        return
+    follower_ids = list(post.author.followers.values_list('id', flat=True))
+    for start in range(0, len(follower_ids), BATCH_SIZE):
+        batch = follower_ids[start:start + BATCH_SIZE]
+        TimelineEntry.objects.bulk_create(_entries(batch, [post]), ignore_conflicts=True)
+        trim([user_id for user_id in batch if random.random() * trim_interval() < 1])
+
+
+def backfill(follower_id, author):
+    """Copy author's recent posts into a new follower's timeline."""
+    if not is_fanned_out(author):
+        return
+    posts = list(Post.objects.filter(author=author).order_by('-created_at')[:backfill_limit()])
+    TimelineEntry.objects.bulk_create(_entries([follower_id], posts), ignore_conflicts=True)
+    trim([follower_id])
+
+
+def evict(follower_id, author_id):
+    TimelineEntry.objects.filter(user_id=follower_id, author_id=author_id).delete()
+
+
+def rebuild(user):
+    """Regenerate user's timeline from scratch."""
+    TimelineEntry.objects.filter(user=user).delete()
+    for author in user.following.all():
+        backfill(user.id, author)
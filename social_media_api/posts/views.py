@@ -1,20 +1,25 @@
 from django.shortcuts import render
+from django.db import transaction
 from django.db.models import Q
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404
 from rest_framework import generics, permissions
-from rest_framework import viewsets, status, filters
+from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
-from .models import Post, Comment, Like
-from .serializers import PostSerializer, CommentSerializer, CommentCreateSerializer, PostCreateSerializer, LikeSerializer
-from .pagination import CustomPagination
+from .models import Post, Comment, Like, TimelineEntry, latest_comments_prefetch, latest_likes_prefetch
+from .serializers import PostSerializer, CommentSerializer, CommentCreateSerializer, PostCreateSerializer, LikeSerializer, BulkLikeSerializer, EXPANDED_LIKES_LIMIT, get_comments_limit, get_expanded_fields, split_param
+from .cache import AnonymousResponseCacheMixin, bump_versions
+from .filters import PostSearchFilter, StableOrderingFilter
+from .pagination import CustomPagination, CursorSelectableMixin, PostCursorPagination, CommentCursorPagination, LikeCursorPagination, select_paginator
+from . import timeline
 from accounts.serializers import UserFollowSerializer
-from accounts.models import CustomUser
-from notifications.models import Notification
+from accounts.models import CustomUser, FollowSuggestion
+from accounts import suggestions
+from notifications.models import NotificationOutbox
 
 
 # Create your views here.
@@ -29,25 +34,50 @@ def feed_view(request):
 def post_list_view(request):
     return render(request, 'posts/post_list.html')
 
-class PostViewSet(viewsets.ModelViewSet):
+def expanded_prefetches(request, default=()):
+    """Prefetches for the nested PostSerializer fields this request will render."""
+    expanded = get_expanded_fields(request, default)
+    requested = split_param(request, 'fields')
+    if requested:
+        expanded &= requested
+    prefetches = []
+    if 'likes' in expanded:
+        prefetches.append(latest_likes_prefetch(EXPANDED_LIKES_LIMIT))
+    if 'comments' in expanded:
+        prefetches.append(latest_comments_prefetch(get_comments_limit(request)))
+    return prefetches
+
+class PostViewSet(AnonymousResponseCacheMixin, CursorSelectableMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['title', 'content', 'author__username']
+    filter_backends = [DjangoFilterBackend, PostSearchFilter, StableOrderingFilter]
     ordering_fields = ['created_at', 'updated_at', 'likes_count', 'comments_count']
     ordering = ['-created_at']
     pagination_class = CustomPagination
+    cursor_pagination_class = PostCursorPagination
 
     def get_queryset(self):
-        queryset = Post.objects.all().select_related('author').prefetch_related('likes', 'comments')
+        queryset = Post.objects.all().select_related('author').prefetch_related(
+            *expanded_prefetches(self.request, self.get_default_expand())
+        )
         author = self.request.query_params.get('author', None)
         if author:
             queryset = queryset.filter(author__username=author)
         liked = self.request.query_params.get('liked', None)
         if liked and self.request.user.is_authenticated:
-            queryset = queryset.filter(likes=self.request.user)
+            queryset = queryset.filter(likes__user=self.request.user)
 
         return queryset
 
+    def get_default_expand(self):
+        # The detail view keeps embedding the latest comments; likes are opt-in
+        # (?expand=likes) and paged in full by the likes action.
+        return ['comments'] if self.action == 'retrieve' else []
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand'] = self.get_default_expand()
+        return context
+
     def get_serializer_class(self):
         if self.action == 'create' or self.action == 'update':
             return PostCreateSerializer
@@ -60,19 +90,7 @@ class PostViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def like(self, request, pk=None):
         post = self.get_object()
-        content_type = ContentType.objects.get_for_model(Post)
-
-        like, created = Like.objects.get_or_create(
-            user = request.user,
-            content_type = content_type,
-            object_id = post.id
-        )
-
-        if created:
-            liked = True
-        else:
-            like.delete()
-            liked = False
+        liked = Like.toggle(request.user, post)
         return Response({
             'liked': liked,
             'likes_count': post.likes_count
@@ -82,17 +100,26 @@ class PostViewSet(viewsets.ModelViewSet):
     def comments(self, request, pk=None):
         post = self.get_object()
         comments = post.comments.all().select_related('author')
-        page = self.paginate_queryset(comments)
+        paginator = select_paginator(request, CustomPagination, CommentCursorPagination)
+        page = paginator.paginate_queryset(comments, request, view=self)
 
-        if page is not None:
-            serializer = CommentSerializer(page, many = True, context = {'request': request})
-            return self.get_paginated_response(serializer.data)
-        serializer = CommentSerializer(comments, many = True, context = {'request': request})
-        return Response(serializer.data)
+        serializer = CommentSerializer(page, many = True, context = {'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
-class CommentViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticatedOrReadOnly])
+    def likes(self, request, pk=None):
+        post = self.get_object()
+        likes = post.likes.all().select_related('user')
+        paginator = select_paginator(request, CustomPagination, LikeCursorPagination)
+        page = paginator.paginate_queryset(likes, request, view=self)
+
+        serializer = LikeSerializer(page, many = True, context = {'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+class CommentViewSet(CursorSelectableMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticatedOrReadOnly]
     pagination_class = CustomPagination
+    cursor_pagination_class = CommentCursorPagination
 
     def get_queryset(self):
         queryset = Comment.objects.all().select_related('author', 'post')
@@ -115,34 +142,24 @@ class CommentViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def like(self, request, pk=None):
         comment = self.get_object()
-        content_type = ContentType.objects.get_for_model(Comment)
-
-        like, created = Like.objects.get_or_create(
-            user = request.user,
-            content_type = content_type,
-            object_id = comment.id
-        )
-
-        if created:
-            liked = True
-        else:
-            like.delete()
-            liked = False
+        liked = Like.toggle(request.user, comment)
         return Response({
             'liked': liked,
             'likes_count': comment.likes_count
         })
     
 
-@api_view(['GET'])
-@permission_classes([permissions.IsAuthenticated])
-def user_feed(request):
-    following_users = request.user.following.all()
-    posts = Post.objects.filter(author__in=following_users).order_by('-created_at')
-    posts = posts.select_related('author').prefetch_related('likes', 'comments')
-
-    paginator = CustomPagination()
-    paginated_posts = paginator.paginate_queryset(posts, request)
+def feed_response(request):
+    feed = timeline.home_timeline(request.user)
+    posts = Post.objects.select_related('author').prefetch_related(*expanded_prefetches(request))
+    if feed.model is Post:
+        feed = feed.select_related('author').prefetch_related(*expanded_prefetches(request))
+
+    # Entries and posts share created_at, so the same cursor class pages either.
+    paginator = select_paginator(request, CustomPagination, PostCursorPagination)
+    paginated_posts = paginator.paginate_queryset(feed, request)
+    if feed.model is TimelineEntry:
+        paginated_posts = timeline.entry_posts(paginated_posts, posts)
     serializer = PostSerializer(
         paginated_posts,
         many = True,
@@ -150,23 +167,33 @@ def user_feed(request):
     )
     return paginator.get_paginated_response(serializer.data)
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def user_feed(request):
+    return feed_response(request)
+
 class FeedViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
     def list(self, request):
-        return user_feed(request)
+        return feed_response(request)
 
     @action(detail=False, methods=['get'])
     def suggestions(self, request):
-        users_to_suggest = CustomUser.objects.exclude(
-            Q(id=request.user.id) |
-            Q(id__in=request.user.following.values_list('id', flat=True))
-        )[:10]
+        ranked = FollowSuggestion.objects.filter(user=request.user).select_related('suggested').order_by('-score')[:10]
+        users_to_suggest = [suggestion.suggested for suggestion in ranked]
+        if not users_to_suggest:
+            # Not computed yet: serve popular users now and compute properly in the background.
+            suggestions.queue([request.user.id])
+            users_to_suggest = CustomUser.objects.exclude(
+                Q(id=request.user.id) |
+                Q(id__in=request.user.following.values_list('id', flat=True))
+            ).order_by('-followers_count', 'id')[:10]
 
         serializer = UserFollowSerializer(
             users_to_suggest,
             many = True,
-            context = {'request': request}
+            context = {'request': request, 'following_ids': set()}
         )
         return Response(serializer.data)
 
@@ -181,27 +208,22 @@ class LikeViewSet(viewsets.ViewSet):
         except Post.DoesNotExist:
             return Response({'error': 'Post Not Found'}, status=status.HTTP_404_NOT_FOUND)
         
-        content_type = ContentType.objects.get_for_model(Post)
-        like, created = Like.objects.get_or_create(
-            user = request.user,
-            content_type = content_type,
-            object_id = post.id
-        )
-        if created:
-            if post.author != request.user:
-                Notification.create_notification(
+        with transaction.atomic():
+            liked = Like.toggle(request.user, post)
+            if liked and post.author != request.user:
+                NotificationOutbox.enqueue(
                     recipient=post.author,
                     actor=request.user,
                     verb='like_post',
                     target=post
                 )
+        if liked:
             return Response({
                 'liked': True,
                 'likes_count': post.likes_count,
                 'message': 'Post liked successfully!'
             }, status=status.HTTP_201_CREATED)
         else:
-            like.delete()
             return Response({
                 'liked': False,
                 'likes_count': post.likes_count,
@@ -215,33 +237,79 @@ class LikeViewSet(viewsets.ViewSet):
         except Comment.DoesNotExist:
             return Response({'error': 'Comment Not Found'}, status=status.HTTP_404_NOT_FOUND)
 
-        content_type = ContentType.objects.get_for_model(Comment)
-        like, created = Like.objects.get_or_create(
-            user = request.user,
-            content_type = content_type,
-            object_id = comment.id
-        )
-        if created:
-            if comment.author != request.user:
-                Notification.create_notification(
+        with transaction.atomic():
+            liked = Like.toggle(request.user, comment)
+            if liked and comment.author != request.user:
+                NotificationOutbox.enqueue(
                     recipient=comment.author,
                     actor=request.user,
                     verb='like_comment',
                     target=comment
                 )
+        if liked:
             return Response({
                 'liked':True,
                 'likes_count': comment.likes_count,
                 'message': 'Comment liked successfully!'
             }, status=status.HTTP_201_CREATED)
         else:
-            like.delete()
             return Response({
                 'liked': False,
                 'likes_count': comment.likes_count,
                 'message': 'Comment unliked Successfully!'
             }, status=status.HTTP_200_OK)
     
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        serializer = BulkLikeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # Later items win when the same target appears twice.
+        wanted = {}
+        for item in serializer.validated_data['items']:
+            wanted[(item['type'], item['id'])] = item['liked']
+
+        models = {'post': Post, 'comment': Comment}
+        found = {}
+        for type_name, model in models.items():
+            ids = [object_id for (kind, object_id) in wanted if kind == type_name]
+            queryset = model.objects.filter(id__in=ids).select_related('author')
+            found.update({(type_name, target.id): target for target in queryset})
+
+        targets = {target: wanted[key] for key, target in found.items()}
+        with transaction.atomic():
+            newly_liked = Like.bulk_set(request.user, targets) if targets else []
+            NotificationOutbox.enqueue_many(
+                {
+                    'recipient': target.author,
+                    'actor': request.user,
+                    'verb': 'like_post' if isinstance(target, Post) else 'like_comment',
+                    'target': target
+                }
+                for target in newly_liked if target.author_id != request.user.id
+            )
+        post_ids = {target.id if isinstance(target, Post) else target.post_id for target in targets}
+        bump_versions(post_ids)
+
+        counts = {}
+        for type_name, model in models.items():
+            ids = [object_id for (kind, object_id) in found if kind == type_name]
+            counts.update({
+                (type_name, object_id): likes_count
+                for object_id, likes_count in model.objects.filter(id__in=ids).values_list('id', 'likes_count')
+            })
+
+        return Response({
+            'results': [
+                {'type': type_name, 'id': object_id, 'liked': liked, 'likes_count': counts[(type_name, object_id)]}
+                for (type_name, object_id), liked in wanted.items() if (type_name, object_id) in found
+            ],
+            'not_found': [
+                {'type': type_name, 'id': object_id}
+                for (type_name, object_id) in wanted if (type_name, object_id) not in found
+            ]
+        }, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['post'], url_path='my-likes')
     def my_likes(self, request):
         post_content_type = ContentType.objects.get_for_model(Post)
@@ -250,7 +318,7 @@ class LikeViewSet(viewsets.ViewSet):
                 user = request.user,
                 content_type = post_content_type
             ).values_list('object_id', flat=True)
-        )
+        ).select_related('author').prefetch_related(*expanded_prefetches(request))
 
         comment_content_type = ContentType.objects.get_for_model(Comment)
         liked_comments = Comment.objects.filter(
@@ -258,7 +326,7 @@ class LikeViewSet(viewsets.ViewSet):
                 user = request.user,
                 content_type = comment_content_type
             ).values_list('object_id', flat=True)
-        )
+        ).select_related('author')
 
         post_serializer = PostSerializer(
             liked_posts,
@@ -281,22 +349,22 @@ class PostLikeView(generics.GenericAPIView):
     def post(self, request, pk=None):
         post = generics.get_object_or_404(Post, pk=pk)
 
-        like, created = Like.objects.get_or_create(user=request.user, post=post)
-        if created:
-            if post.author != request.user:
-                Notification.objects.create(
+        with transaction.atomic():
+            liked = Like.toggle(request.user, post)
+            if liked and post.author != request.user:
+                NotificationOutbox.enqueue(
                     recipient = post.author,
                     actor = request.user,
                     verb = 'like_post',
                     target = post
                 )
+        if liked:
             return Response({
                 'liked': True,
                 'likes_count': post.likes_count,
                 'message': 'Post liked successfully!'
             }, status=status.HTTP_201_CREATED)
         else:
-            like.delete()
             return Response({
                 'liked': False,
                 'likes_count': post.likes_count,
@@ -0,0 +1,13 @@
+from django.conf import settings
+
+# Several features keep state in the default cache that every web worker and
+# the outbox worker must agree on (token revocation, notification counters).
+# LocMemCache, the default when REDIS_URL is unset, is private to each
+# process, so those features fall back to the database when it is in use.
+
+PROCESS_LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+def cache_is_shared(alias='default'):
+    """Whether writes to the cache are visible to the project's other processes."""
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_BACKENDS
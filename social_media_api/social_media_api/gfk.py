@@ -0,0 +1,72 @@
+from collections import defaultdict
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.contenttypes.models import ContentType
+
+# Accessing a GenericForeignKey costs one query per row. resolve_generic
+# fetches the targets of a whole list of rows with one query per content type
+# and stores them in each row's GFK cache, so later attribute access is free.
+# Django's GFK treats a cached None as "not loaded" and queries again, so
+# code reading rows whose target may be deleted should use resolved_target.
+
+UNRESOLVED = object()
+
+
+def resolve_generic(instances, field_name, related=None):
+    """Attach the targets of GenericForeignKey field_name to every instance.
+
+    related maps a target model to the select_related() lookups to load with
+    it, e.g. {Comment: ['post']}. Rows whose target no longer exists get None.
+    Returns instances as a list.
+    """
+    instances = list(instances)
+    if not instances:
+        return instances
+
+    field = instances[0]._meta.get_field(field_name)
+    ct_attname = instances[0]._meta.get_field(field.ct_field).get_attname()
+    related = related or {}
+
+    def key(instance):
+        return getattr(instance, ct_attname), getattr(instance, field.fk_field)
+
+    ids_by_type = defaultdict(set)
+    for instance in instances:
+        content_type_id, object_id = key(instance)
+        if content_type_id is not None and object_id is not None:
+            ids_by_type[content_type_id].add(object_id)
+
+    targets = {}
+    for content_type_id, object_ids in ids_by_type.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is None:
+            continue
+        queryset = model._default_manager.filter(pk__in=object_ids)
+        if related.get(model):
+            queryset = queryset.select_related(*related[model])
+        targets.update({(content_type_id, target.pk): target for target in queryset})
+
+    for instance in instances:
+        field.set_cached_value(instance, targets.get(key(instance)))
+    return instances
+
+
+def resolved_target(instance, field_name):
+    """The target resolve_generic attached, or None if it no longer exists.
+
+    Unlike attribute access, a missing target is not queried again. Rows that
+    were never resolved fall back to attribute access.
+    """
+    target = instance._meta.get_field(field_name).get_cached_value(instance, default=UNRESOLVED)
+    if target is UNRESOLVED:
+        return getattr(instance, field_name)
+    return target
+
+
+class GenericResolvingChangeList(ChangeList):
+    """Admin changelist that resolves generic_field for the whole page at once."""
+    generic_field = None
+    generic_related = None
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.result_list = resolve_generic(self.result_list, self.generic_field, self.generic_related)
@@ -3,6 +3,8 @@ from django.db import connection
 from django.db.utils import OperationalError
 from django.core.cache import cache
 from django.utils import timezone
+from posts.cache import cache_stats
+from notifications.outbox import queue_stats
 
 def health_check(request):
     checks = {}
@@ -26,6 +28,8 @@ def health_check(request):
     return JsonResponse({
         'status': 'healthy' if overall_health else 'unhealthy',
         'checks': checks,
+        'post_response_cache': cache_stats(),
+        'notification_outbox': queue_stats() if checks['database'] == 'healthy' else None,
         'timestamp': timezone.now().isoformat()
     })
 
@@ -118,6 +118,25 @@ if not DEBUG:
         conn_health_checks=True,
     )
 '''
+# Cache
+# Post response caching and counters need a cache shared by all workers in
+# production; set REDIS_URL to use Redis instead of the per-process default.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+
+POST_RESPONSE_CACHE_TIMEOUT = config('POST_RESPONSE_CACHE_TIMEOUT', default=300, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -169,7 +188,7 @@ AUTH_USER_MODEL = 'accounts.CustomUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -187,9 +206,81 @@ REST_FRAMEWORK = {
     ]
 }
 
+# Token lookups are cached in the shared cache and, briefly, in each process;
+# see accounts.authentication. A revoked token can keep working on other
+# processes for up to AUTH_TOKEN_LOCAL_TIMEOUT seconds. Without REDIS_URL the
+# cache is per process, so only the per-process copy is kept.
+AUTH_TOKEN_CACHE_TIMEOUT = config('AUTH_TOKEN_CACHE_TIMEOUT', default=300, cast=int)
+AUTH_TOKEN_LOCAL_TIMEOUT = config('AUTH_TOKEN_LOCAL_TIMEOUT', default=10, cast=int)
+AUTH_TOKEN_LOCAL_SIZE = config('AUTH_TOKEN_LOCAL_SIZE', default=10000, cast=int)
+
 if DEBUG:
     REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('rest_framework.renderers.BrowsableAPIRenderer')
 
+# Home timelines are fanned out on write for authors up to this many
+# followers; more popular authors are merged into feeds at read time.
+TIMELINE_FANOUT_THRESHOLD = config('TIMELINE_FANOUT_THRESHOLD', default=10000, cast=int)
+TIMELINE_BACKFILL_LIMIT = config('TIMELINE_BACKFILL_LIMIT', default=200, cast=int)
+# Timelines keep their newest TIMELINE_MAX_ENTRIES posts; fan-out trims each
+# follower about once every TIMELINE_TRIM_INTERVAL posts it delivers.
+TIMELINE_MAX_ENTRIES = config('TIMELINE_MAX_ENTRIES', default=800, cast=int)
+TIMELINE_TRIM_INTERVAL = config('TIMELINE_TRIM_INTERVAL', default=20, cast=int)
+
+# Post search engine. Left unset, SQLite uses FTS5 and PostgreSQL uses a
+# tsvector/GIN index; see posts.search. Run rebuild_search_index once after
+# deploying to populate the index.
+POST_SEARCH_BACKEND = config('POST_SEARCH_BACKEND', default='')
+POST_SEARCH_MAX_RESULTS = config('POST_SEARCH_MAX_RESULTS', default=500, cast=int)
+
+# Memory-mapped follow graph snapshot used for is_following flags and follower
+# lists; see accounts.graph. Build it with build_follow_graph and rebuild it
+# periodically to compact the delta log. The directory must be shared by every
+# process that follows or unfollows, so leave it unset when web processes run
+# on separate hosts; lookups then use the database.
+FOLLOW_GRAPH_DIR = config('FOLLOW_GRAPH_DIR', default='')
+FOLLOW_GRAPH_REFRESH_INTERVAL = config('FOLLOW_GRAPH_REFRESH_INTERVAL', default=1.0, cast=float)
+
+# Precomputed follow suggestions; run refresh_follow_suggestions from a
+# scheduler to drain the refresh queue (and with --all nightly).
+FOLLOW_SUGGESTIONS_LIMIT = config('FOLLOW_SUGGESTIONS_LIMIT', default=50, cast=int)
+FOLLOW_SUGGESTIONS_POPULARITY_WEIGHT = config('FOLLOW_SUGGESTIONS_POPULARITY_WEIGHT', default=0.5, cast=float)
+
+# User search and autocomplete. Each process keeps the USER_AUTOCOMPLETE_SIZE
+# most-followed usernames in memory (0 disables it), reloaded in a background
+# thread every USER_AUTOCOMPLETE_REFRESH_INTERVAL seconds. Substring matches use a pg_trgm
+# index on PostgreSQL; elsewhere they scan at most USER_SEARCH_SCAN_LIMIT rows.
+USER_AUTOCOMPLETE_SIZE = config('USER_AUTOCOMPLETE_SIZE', default=100000, cast=int)
+USER_AUTOCOMPLETE_REFRESH_INTERVAL = config('USER_AUTOCOMPLETE_REFRESH_INTERVAL', default=300, cast=int)
+USER_SEARCH_SCAN_LIMIT = config('USER_SEARCH_SCAN_LIMIT', default=5000, cast=int)
+
+# Profile pictures are resized into 48/96/256px WebP and JPEG thumbnails by a
+# pool of PROFILE_IMAGE_WORKERS processes per web worker; see accounts.images.
+# Run process_profile_pictures once after deploying to backfill existing users.
+PROFILE_IMAGE_WORKERS = config('PROFILE_IMAGE_WORKERS', default=2, cast=int)
+
+# Notifications are queued in NotificationOutbox and written by the
+# process_notification_outbox worker. Failed batches are retried with
+# exponential backoff up to NOTIFICATION_OUTBOX_MAX_ATTEMPTS times.
+NOTIFICATION_OUTBOX_BATCH_SIZE = config('NOTIFICATION_OUTBOX_BATCH_SIZE', default=500, cast=int)
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = config('NOTIFICATION_OUTBOX_MAX_ATTEMPTS', default=8, cast=int)
+# Likes of the same target within this many seconds share one unread notification.
+NOTIFICATION_COALESCE_WINDOW = config('NOTIFICATION_COALESCE_WINDOW', default=86400, cast=int)
+# Lifetime of the cached per-user unread/total counters behind the badge. They
+# are only cached when REDIS_URL gives every process the same cache.
+NOTIFICATION_COUNTER_TIMEOUT = config('NOTIFICATION_COUNTER_TIMEOUT', default=3600, cast=int)
+# Retention enforced by the prune_notifications command (run it daily).
+NOTIFICATION_RETENTION_DAYS = config('NOTIFICATION_RETENTION_DAYS', default=90, cast=int)
+NOTIFICATION_MAX_PER_USER = config('NOTIFICATION_MAX_PER_USER', default=1000, cast=int)
+
+# Live notification stream (Server-Sent Events, served over ASGI). 'memory'
+# only reaches clients connected to the publishing process; use 'redis' when
+# the outbox worker and web processes are separate. Browsers open the stream
+# with a signed ticket valid for NOTIFICATION_STREAM_TICKET_MAX_AGE seconds.
+NOTIFICATION_BROKER = config('NOTIFICATION_BROKER', default='redis' if REDIS_URL else 'memory')
+NOTIFICATION_STREAM_HEARTBEAT = config('NOTIFICATION_STREAM_HEARTBEAT', default=20, cast=int)
+NOTIFICATION_STREAM_MAX_AGE = config('NOTIFICATION_STREAM_MAX_AGE', default=300, cast=int)
+NOTIFICATION_STREAM_TICKET_MAX_AGE = config('NOTIFICATION_STREAM_TICKET_MAX_AGE', default=60, cast=int)
+
 #CORS_ALLOWED_ORIGINS = [
 #    'http://localhost:3000',
 #    'http://127.0.0.1:3000',
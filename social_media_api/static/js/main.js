@@ -39,7 +39,11 @@ $(document).ready(function() {
     
     // Update notification badge on all pages
     if (token) {
-        updateNotificationBadge();
+        if (window.EventSource) {
+            subscribeToNotifications();
+        } else {
+            pollNotificationBadge();
+        }
     }
 });
 
@@ -80,19 +84,13 @@ function updateNotificationBadge() {
     if (!token) return;
     
     $.ajax({
-        url: '/api/notifications/count/',
+        url: '/notifications/api/notifications/count/',
         type: 'GET',
         headers: {
             'Authorization': `Token ${token}`
         },
         success: function(response) {
-            const $badge = $('#notification-badge');
-            
-            if (response.unread_count > 0) {
-                $badge.text(response.unread_count).removeClass('d-none');
-            } else {
-                $badge.addClass('d-none');
-            }
+            renderNotificationBadge(response.unread_count);
         },
         error: function() {
             // Silently fail - don't show error for notification count
@@ -100,6 +98,87 @@ function updateNotificationBadge() {
     });
 }
 
+function renderNotificationBadge(unreadCount) {
+    const $badge = $('#notification-badge');
+
+    if (unreadCount > 0) {
+        $badge.text(unreadCount).removeClass('d-none');
+    } else {
+        $badge.addClass('d-none');
+    }
+}
+
+const NOTIFICATION_POLL_INTERVAL = 30000;
+const NOTIFICATION_STREAM_TIMEOUT = 5000;
+const NOTIFICATION_RECONNECT_DELAY = 1000;
+
+function pollNotificationBadge() {
+    updateNotificationBadge();
+    setInterval(updateNotificationBadge, NOTIFICATION_POLL_INTERVAL);
+}
+
+// Live badge updates over Server-Sent Events
+function subscribeToNotifications() {
+    const token = localStorage.getItem('auth_token');
+
+    if (!token) return;
+
+    // EventSource cannot send the Authorization header, so trade the token
+    // for a short-lived stream ticket instead of putting it in the URL.
+    $.ajax({
+        url: '/notifications/api/stream/ticket/',
+        type: 'POST',
+        headers: {
+            'Authorization': `Token ${token}`
+        },
+        success: function(response) {
+            openNotificationStream(response.ticket);
+        },
+        error: function() {
+            pollNotificationBadge();
+        }
+    });
+}
+
+function openNotificationStream(ticket) {
+    const source = new EventSource(`/notifications/api/stream/?ticket=${encodeURIComponent(ticket)}`);
+    let received = false;
+    let polling = false;
+
+    // The stream sends the unread count as soon as it opens. A server that
+    // cannot stream (e.g. runserver or gunicorn without the ASGI worker)
+    // buffers it instead, so fall back to polling the count.
+    function fallBackToPolling() {
+        if (received || polling) return;
+        polling = true;
+        source.close();
+        pollNotificationBadge();
+    }
+    const timeout = setTimeout(fallBackToPolling, NOTIFICATION_STREAM_TIMEOUT);
+    source.addEventListener('error', function() {
+        clearTimeout(timeout);
+        if (received) {
+            // The server ends streams every few minutes and the ticket has
+            // expired by then, so reconnect with a fresh one.
+            source.close();
+            setTimeout(subscribeToNotifications, NOTIFICATION_RECONNECT_DELAY);
+        } else {
+            fallBackToPolling();
+        }
+    });
+
+    source.addEventListener('unread_count', function(event) {
+        received = true;
+        renderNotificationBadge(JSON.parse(event.data).unread_count);
+    });
+    source.addEventListener('notification', function(event) {
+        $(document).trigger('notification:received', [JSON.parse(event.data)]);
+    });
+    window.addEventListener('beforeunload', function() {
+        source.close();
+    });
+}
+
 // Format date relative to now
 function formatRelativeTime(dateString) {
     const date = new Date(dateString);